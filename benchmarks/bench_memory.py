@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+"""bench_memory.py: Memory used by parsed assets.
+
+Usage: python benchmarks/bench_memory.py [count]
+"""
+
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from forticare import Asset  # noqa: E402
+
+__author__ = "Charles Prevot"
+__copyright__ = "Copyright 2024"
+
+
+def _service(index: int) -> dict:
+    return {
+        "startDate": "2023-01-18T00:00:00",
+        "endDate": "2025-01-18T00:00:00",
+        "level": str(20 + index),
+        "levelDesc": "Premium",
+        "type": str(index),
+        "typeDesc": "FortiCare Support",
+    }
+
+
+def _contract(index: int) -> dict:
+    return {
+        "contractNumber": f"5762CL38{index:04d}",
+        "sku": "FC2-10-CGSLB-330-02-12",
+        "terms": [
+            {"startDate": "2023-01-18T00:00:00", "endDate": "2025-01-18T00:00:00", "supportType": "Telephone Support"},
+            {"startDate": "2023-01-18T00:00:00", "endDate": "2025-01-18T00:00:00", "supportType": "Enhanced Support"},
+        ],
+    }
+
+
+def sample_asset(index: int) -> dict:
+    """Build a `/products/list` asset with 3 entitlements, 1 warranty and 2 contracts of 2 terms"""
+    return {
+        "serialNumber": f"FGT60F{index:010d}",
+        "productModel": "FortiGate 60F",
+        "description": "",
+        "isDecommissioned": False,
+        "registrationDate": "2023-01-18T00:13:44",
+        "folderId": 1,
+        "folderPath": "/My Assets",
+        "status": "Registered",
+        "entitlements": [_service(index) for index in range(3)],
+        "warrantySupports": [_service(9)],
+        "contracts": [_contract(index) for index in range(2)],
+        "assetGroups": [{"assetGroupId": 1, "assetGroup": "Lab"}],
+        "licenses": [],
+        "productModelEoR": None,
+        "productModelEoS": None,
+    }
+
+
+def measure(count: int, lazy: bool = False) -> float:
+    """Return the bytes allocated per Asset kept alive, raw responses excluded"""
+    responses = [sample_asset(index) for index in range(count)]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    assets = [Asset(response, lazy=lazy) for response in responses]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del assets
+    return (after - before) / count
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    print(f"Asset: {measure(count):.0f} bytes per asset ({count} assets)")
+    print(f"Asset(lazy=True): {measure(count, lazy=True):.0f} bytes per asset ({count} assets)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+"""bench_parse_datetime.py: Date parsing speed.
+
+Usage: python benchmarks/bench_parse_datetime.py [count]
+"""
+
+import os
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from forticare.asset import _parse_datetime, parse_datetime  # noqa: E402
+
+__author__ = "Charles Prevot"
+__copyright__ = "Copyright 2024"
+
+
+def strptime_parse(date: str) -> datetime:
+    """Reference implementation: try every format with strptime"""
+    for _f in ["%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S%z"]:
+        try:
+            return datetime.strptime(str(date), _f)
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid date format: {date}")
+
+
+def sample_dates(count: int, distinct: int) -> list[str]:
+    """Dates as found in a product list: few distinct values, repeated"""
+    start = datetime(2020, 1, 1)
+    values = [(start + timedelta(days=day)).strftime("%Y-%m-%dT%H:%M:%S") for day in range(distinct)]
+    return [random.choice(values) for _ in range(count)]
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    dates = sample_dates(count, 1000)
+    unique = [(datetime(2020, 1, 1) + timedelta(seconds=index)).strftime("%Y-%m-%dT%H:%M:%S") for index in range(count)]
+
+    def _uncached(values):
+        for value in values:
+            _parse_datetime.__wrapped__(value, "endDate")
+
+    def _cached(values):
+        _parse_datetime.cache_clear()
+        for value in values:
+            parse_datetime(value, "endDate")
+
+    reference = timeit.timeit(lambda: [strptime_parse(value) for value in dates], number=1)
+    print(f"strptime:            {reference:.3f}s ({count} dates)")
+    for name, func, values in (
+        ("fast path, unique", _uncached, unique),
+        ("fast path", _uncached, dates),
+        ("fast path + cache", _cached, dates),
+    ):
+        elapsed = timeit.timeit(lambda: func(values), number=1)
+        print(f"{name + ':':<21}{elapsed:.3f}s, x{reference / elapsed:.1f}")
+
+
+if __name__ == "__main__":
+    main()
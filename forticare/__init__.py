@@ -3,29 +3,104 @@
 FortiCare API wrapper for Python
 """
 
+import threading
+
 from .asset import Asset, Service, License
 from .location import Location
-from .registration_unit import LicenseRegistrationUnit, ProductRegistrationUnit, ServiceRegistrationUnit
+from .registration_unit import (
+    LicenseRegistrationUnit,
+    ProductRegistrationUnit,
+    RegistrationResult,
+    ServiceRegistrationUnit,
+)
+from ._core import _load_stored_token, _schedule_refresh
+from ._session import _build_session
+from ._metrics import Metrics
+from ._retry import RetryPolicy
+from ._ratelimit import RateLimiter, MemoryRateLimitBackend, FileRateLimitBackend
+from ._token_store import FileTokenStore
+from ._cache import ResponseCache
+from ._journal import RegistrationJournal
+from ._license_store import LicenseStore
+from ._loader import load_units
+from ._validation import ValidationReport, validate_units
+from ._table import AssetTable
+from ._expiry_index import ExpiryIndex
+from ._async import AsyncFortiCare
 
 
 class FortiCare(object):
     """
     FortiCare API wrapper
+
+    Every endpoint shares one pooled, keep-alive HTTP session. Call `close()` when done,
+    or use the client as a context manager.
     """
 
-    def __init__(self, api_user=None, api_key=None, auto_login=False, timeout=20, debug=False):
+    def __init__(
+        self,
+        api_user=None,
+        api_key=None,
+        auto_login=False,
+        timeout=20,
+        debug=False,
+        pool_connections=10,
+        pool_maxsize=10,
+        pool_block=False,
+        keep_alive=True,
+        prewarm=False,
+        retry=None,
+        rate_limiter=None,
+        proactive_refresh=True,
+        refresh_margin=60,
+        token_store=None,
+        cache=None,
+        coalesce=True,
+        license_store=None,
+    ):
         self._api_user = api_user
         self._api_key = api_key
         self._token = None
+        self._token_expires_at = None
+        self._token_lifetime = None
+        self._token_lock = threading.RLock()
+        self._refresh_timer = None
+        self._proactive_refresh = proactive_refresh
+        self._refresh_margin = refresh_margin
+        self._token_store = token_store
         self._auto_login = auto_login
         self._timeout = timeout
         self._debug = debug
+        self._session = _build_session(pool_connections, pool_maxsize, pool_block, keep_alive)
+        self._retry = retry if retry is not None else RetryPolicy()
+        self._rate_limiter = rate_limiter
+        self._cache = cache
+        self._coalesce = coalesce
+        self._inflight = {}
+        self._license_store = license_store
+        self._inflight_lock = threading.Lock()
+        self._metrics = Metrics()
+        if _load_stored_token(self):
+            _schedule_refresh(self)
+        if prewarm:
+            self.prewarm()
 
     from ._helpers import _post
     from ._core import login
-    from ._license import get_licenses, register_licenses, download_licenses
-    from ._product import get_products, get_product_details, register_product
-    from ._service import register_services
+    from ._license import get_licenses, register_licenses, register_licenses_bulk
+    from ._license import download_licenses, download_licenses_bulk
+    from ._product import get_products, iter_products, sweep_inventory
+    from ._product import get_product_details, get_products_details, register_product, register_products_bulk
+    from ._service import register_services, register_services_bulk
+    from ._loader import register_from_file
+    from ._table import get_products_table
+    from ._session import prewarm, close
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     @property
     def token(self):
@@ -34,8 +109,17 @@ class FortiCare(object):
 
     @token.setter
     def token(self, token):
-        """Set API token"""
+        """Set API token. Its expiry is unknown until the next login."""
         self._token = token
+        self._token_expires_at = None
+        self._token_lifetime = None
+        if self._cache is not None:
+            self._cache.clear_errors()  # they may come from the previous token
+
+    @property
+    def token_expires_at(self):
+        """Get token expiry as a POSIX timestamp, None if unknown"""
+        return self._token_expires_at
 
     @property
     def api_user(self):
@@ -77,6 +161,51 @@ class FortiCare(object):
         """Set timeout"""
         self._timeout = timeout
 
+    @property
+    def retry(self):
+        """Get retry policy"""
+        return self._retry
+
+    @retry.setter
+    def retry(self, retry):
+        """Set retry policy"""
+        self._retry = retry
+
+    @property
+    def rate_limiter(self):
+        """Get rate limiter"""
+        return self._rate_limiter
+
+    @rate_limiter.setter
+    def rate_limiter(self, rate_limiter):
+        """Set rate limiter"""
+        self._rate_limiter = rate_limiter
+
+    @property
+    def cache(self):
+        """Get response cache"""
+        return self._cache
+
+    @cache.setter
+    def cache(self, cache):
+        """Set response cache"""
+        self._cache = cache
+
+    @property
+    def license_store(self):
+        """Get license file store"""
+        return self._license_store
+
+    @license_store.setter
+    def license_store(self, license_store):
+        """Set license file store"""
+        self._license_store = license_store
+
+    @property
+    def metrics(self):
+        """Get request, retry and error counters"""
+        return self._metrics.snapshot()
+
     @property
     def debug(self):
         """Get debug"""
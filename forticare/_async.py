@@ -0,0 +1,608 @@
+# -*- coding: utf-8 -*-
+
+"""_async.py: asyncio FortiCare client."""
+
+import asyncio
+import copy
+import logging
+import requests
+import time
+from datetime import datetime
+from typing import AsyncIterator, Iterable, Tuple, Union
+
+try:
+    import httpx
+except ImportError:  # optional dependency: pip install forticare[async]
+    httpx = None
+
+from ._cache import ResponseCache, _affected_serials
+from ._constants import FORTICARE_URL, FC_OAUTH, NON_IDEMPOTENT_ENDPOINTS
+from ._core import _login_body, _handle_login_response, _load_stored_token, _effective_refresh_margin
+from ._helpers import _is_token_error, _raise_for_error, _parse_asset_details
+from ._journal import RegistrationJournal, _begin_single_use, _journal_failure
+from ._metrics import Metrics
+from ._retry import RetryPolicy
+from ._license import _licenses_body, _parse_licenses, _parse_license_file
+from ._product import _products_body, _parse_products, _register_product_body, _parse_register_product
+from .asset import Asset, License
+from .location import Location
+from .registration_unit import LicenseRegistrationUnit, ProductRegistrationUnit, ServiceRegistrationUnit
+
+__author__ = "Charles Prevot"
+__copyright__ = "Copyright 2024"
+
+LOG = logging.getLogger("forticare")
+
+
+class _LeaderCancelled(Exception):
+    """The request shared by coalesced callers was cancelled by its leader"""
+
+
+class AsyncFortiCare(object):
+    """
+    FortiCare API wrapper for asyncio
+
+    Same endpoints as `FortiCare`, as coroutines on top of an httpx connection pool.
+    At most `max_concurrency` requests are in flight at once, other callers wait their turn.
+    The token is refreshed before each request that would reach it within `refresh_margin` seconds of expiry.
+    """
+
+    def __init__(
+        self,
+        api_user=None,
+        api_key=None,
+        auto_login=False,
+        timeout=20,
+        debug=False,
+        max_connections=100,
+        max_keepalive_connections=20,
+        max_concurrency=50,
+        retry=None,
+        rate_limiter=None,
+        refresh_margin=60,
+        token_store=None,
+        cache=None,
+        coalesce=True,
+        license_store=None,
+    ):
+        if httpx is None:
+            raise ImportError("AsyncFortiCare requires httpx. Install it with: pip install forticare[async]")
+        self._api_user = api_user
+        self._api_key = api_key
+        self._token = None
+        self._token_expires_at = None
+        self._token_lifetime = None
+        self._token_lock = asyncio.Lock()
+        self._refresh_margin = refresh_margin
+        self._token_store = token_store
+        self._auto_login = auto_login
+        self._timeout = timeout
+        self._debug = debug
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections)
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._retry = retry if retry is not None else RetryPolicy()
+        self._rate_limiter = rate_limiter
+        self._cache = cache
+        self._coalesce = coalesce
+        self._inflight = {}
+        self._license_store = license_store
+        self._metrics = Metrics()
+        _load_stored_token(self)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self) -> None:
+        """Close every pooled connection"""
+        await self._client.aclose()
+
+    async def login(self, api_user: str = "", api_key: str = "") -> bool:
+        """
+        Retrive a new token for authentication.
+        :param api_user: API user to authenticate
+        :type api_user: str
+        :param api_user: API password
+        :type api_user: str
+        :return bool: True if login success, False if login failed
+        """
+        body = _login_body(self, api_user, api_key)
+        if body is None:
+            return False
+        LOG.info("> Retrieving API Token on FortiCare")
+        self._metrics.incr("logins")
+        async with self._semaphore:
+            results = await self._client.post(FC_OAUTH, json=body, timeout=self.timeout)
+        # storing the token takes a file lock with FileTokenStore: keep it off the event loop
+        return await asyncio.to_thread(_handle_login_response, self, results)
+
+    def _token_expiring(self) -> bool:
+        expires_at = self._token_expires_at
+        return expires_at is not None and time.time() >= expires_at - _effective_refresh_margin(self)
+
+    async def _refresh_token(self, stale_token: str) -> bool:
+        """Log in again, once for every coroutine waiting on the same stale token"""
+        async with self._token_lock:
+            if self.token and self.token != stale_token and not self._token_expiring():
+                return True
+            return await self.login()
+
+    async def _ensure_token(self) -> str:
+        """Get a token usable for the next request, logging in first if it is missing or about to expire"""
+        token = self.token
+        if token and not self._token_expiring():
+            return token
+        if not self._auto_login:
+            if token:
+                return token
+            raise ValueError("Token is missing. Please login first.")
+        await self._refresh_token(token)
+        return self.token
+
+    async def _wait_before_retry(self, endpoint: str, attempt: int, reason: str, retry_after: str = None) -> None:
+        delay = self._retry.backoff(attempt, retry_after)
+        LOG.warning("> POST %s failed (%s), retrying in %.2fs (attempt %d)", endpoint, reason, delay, attempt + 1)
+        self._metrics.incr("retries")
+        self._metrics.incr(f"retries:{endpoint}")
+        await asyncio.sleep(delay)
+
+    async def _send(self, endpoint: str, body: dict) -> dict:
+        url = FORTICARE_URL + endpoint
+
+        token = await self._ensure_token()
+        attempt = 0
+        relogged = False
+        while True:
+            attempt += 1
+            if self._rate_limiter is not None:
+                # the limiter takes a lock, and a file lock with FileRateLimitBackend: keep it off the event loop
+                delay = await asyncio.to_thread(self._rate_limiter.reserve, endpoint)
+                if delay > 0:
+                    self._metrics.incr("rate_limited")
+                    await asyncio.sleep(delay)
+            self._metrics.incr("requests")
+            try:
+                async with self._semaphore:
+                    results = await self._client.post(
+                        url, headers={"Authorization": f"Bearer {token}"}, json=body, timeout=self.timeout
+                    )
+            except httpx.TransportError as exp:
+                # a connect error means the request never reached the server
+                sent = not isinstance(exp, (httpx.ConnectError, httpx.ConnectTimeout))
+                if not self._retry.should_retry(endpoint, attempt, sent=sent):
+                    self._metrics.incr("errors")
+                    raise exp
+                await self._wait_before_retry(endpoint, attempt, type(exp).__name__)
+                continue
+            LOG.debug("POST %s: HTTP %s", endpoint, results.status_code)
+            if self._rate_limiter is not None:
+                if results.status_code == 429:
+                    self._metrics.incr("throttled")
+                    await asyncio.to_thread(self._rate_limiter.on_throttled, endpoint)
+                elif results.status_code < 400:
+                    await asyncio.to_thread(self._rate_limiter.on_success, endpoint)
+            if self._retry.should_retry(endpoint, attempt, status_code=results.status_code):
+                await self._wait_before_retry(
+                    endpoint, attempt, f"HTTP {results.status_code}", results.headers.get("Retry-After")
+                )
+                continue
+
+            try:
+                j_data = results.json()
+            except ValueError:
+                if results.status_code < 400:
+                    raise
+                j_data = {}
+            if results.status_code < 400:
+                return j_data
+            self._metrics.incr("errors")
+            # refresh token, once per call
+            if _is_token_error(results.status_code, j_data):
+                if self._auto_login and not relogged and await self._refresh_token(token):
+                    relogged = True
+                    token = self.token
+                    continue
+                raise requests.exceptions.HTTPError(
+                    results.status_code, f"POST {endpoint} {j_data['error']['message']}"
+                )
+            _raise_for_error(endpoint, results, j_data)
+            return j_data
+
+    async def _send_coalesced(self, endpoint: str, body: dict) -> dict:
+        """Send a request, sharing one in-flight call between concurrent identical read requests"""
+        if not self._coalesce or endpoint in NON_IDEMPOTENT_ENDPOINTS:
+            return await self._send(endpoint, body)
+        key = ResponseCache.key(endpoint, body)
+        inflight = self._inflight.get(key)  # [future, number of followers]
+        if inflight is not None:
+            self._metrics.incr("coalesced")
+            inflight[1] += 1
+            try:
+                return copy.deepcopy(await asyncio.shield(inflight[0]))
+            except _LeaderCancelled:
+                # the leader's caller gave up, not ours: send the request again, one follower leading
+                return await self._send_coalesced(endpoint, body)
+        future = asyncio.get_running_loop().create_future()
+        inflight = self._inflight[key] = [future, 0]
+        try:
+            j_data = await self._send(endpoint, body)
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            future.exception()  # mark as retrieved when nobody else is waiting
+            raise
+        except BaseException as exp:
+            future.set_exception(exp)
+            future.exception()
+            raise
+        else:
+            future.set_result(j_data)
+            # followers copy the shared response, the leader gets its own copy too
+            return copy.deepcopy(j_data) if inflight[1] > 0 else j_data
+        finally:
+            del self._inflight[key]
+
+    async def _post(self, endpoint: str, body: dict = {}) -> dict:
+        cache = self._cache if self._cache is not None and self._cache.is_cached(endpoint) else None
+        if cache is not None:
+            hit, j_data = cache.get(endpoint, body)
+            if hit:
+                self._metrics.incr("cache_hits")
+                return j_data
+            self._metrics.incr("cache_misses")
+        try:
+            j_data = await self._send_coalesced(endpoint, body)
+        except requests.exceptions.HTTPError as exp:
+            if cache is not None and cache.is_negative(exp):
+                cache.set_error(endpoint, body, exp)
+            raise exp
+        if cache is not None:
+            cache.set(endpoint, body, j_data)
+        elif self._cache is not None and endpoint in NON_IDEMPOTENT_ENDPOINTS:
+            self._cache.invalidate(_affected_serials(body, j_data))
+        return j_data
+
+    async def get_products(
+        self,
+        expire_before: datetime,
+        serial_number: str = "",
+        product_model: str = "",
+        status: str = "Registered",
+        lazy: bool = False,
+        raw: bool = False,
+    ) -> list[Asset]:
+        """
+        Returns product list based on product SN search pattern or support package expiration date.
+        See `FortiCare.get_products`.
+        :return list: Return a list of assets
+        """
+        body = _products_body(expire_before, serial_number, product_model, status)
+        LOG.info("> Retriving assets list...")
+        try:
+            results = await self._post("/products/list", body)
+        except Exception as exp:
+            LOG.error(">>> Failed to retrive assets: %s", str(exp.args))
+            raise exp
+        return _parse_products(results, lazy, raw)
+
+    async def _fetch_products_page(self, body: dict, page_number: int) -> dict:
+        results = await self._post("/products/list", dict(body, pageNumber=page_number))
+        if not isinstance(results, dict) or "assets" not in results:
+            raise Exception("Inexpected response from API:/n%s", results)
+        return results
+
+    async def iter_products(
+        self,
+        expire_before: datetime,
+        serial_number: str = "",
+        product_model: str = "",
+        status: str = "Registered",
+        prefetch: bool = False,
+        lazy: bool = False,
+        raw: bool = False,
+    ) -> AsyncIterator[Asset]:
+        """
+        Iterate over every page of the product list, one asset at a time.
+        See `FortiCare.iter_products`.
+        :return AsyncIterator: Yield assets
+        """
+        body = _products_body(expire_before, serial_number, product_model, status)
+        LOG.info("> Retriving assets list...")
+        next_page = None
+        try:
+            page_number = 1
+            results = await self._fetch_products_page(body, page_number)
+            while True:
+                total_pages = results.get("totalPages") or 1
+                if prefetch and page_number < total_pages:
+                    next_page = asyncio.ensure_future(self._fetch_products_page(body, page_number + 1))
+                for asset in results["assets"] or []:
+                    yield asset if raw else Asset(asset, lazy)
+                if page_number >= total_pages:
+                    return
+                page_number += 1
+                if next_page is not None:
+                    results, next_page = await next_page, None
+                else:
+                    results = await self._fetch_products_page(body, page_number)
+        except Exception as exp:
+            LOG.error(">>> Failed to retrive assets: %s", str(exp.args))
+            raise exp
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+
+    async def get_product_details(self, serial_number: str, raw: bool = False) -> Asset:
+        """
+        Returns product details based on product SN.
+        :param serial_number: Serial number or serial number search pattern
+        :type serial_number: str
+        :param raw: Return the JSON object of the API response instead of an Asset object
+        :type raw: bool
+        :return Asset: Return asset details
+        """
+        LOG.info("> Retriving asset details...")
+        try:
+            results = await self._post("/products/details", {"serialNumber": str(serial_number)})
+        except Exception as exp:
+            LOG.error(">>> Failed to retrive asset details: %s", str(exp.args))
+            raise exp
+        return _parse_asset_details(results, raw)
+
+    async def get_products_details(
+        self, serials: Iterable[str], ordered: bool = True
+    ) -> AsyncIterator[Tuple[str, Union[Asset, Exception]]]:
+        """
+        Returns product details for many serial numbers, fetched concurrently (bounded by `max_concurrency`).
+        See `FortiCare.get_products_details`.
+        :return AsyncIterator: Yield (serial_number, Asset or exception) tuples
+        """
+
+        async def _fetch(serial: str):
+            try:
+                return serial, await self.get_product_details(serial)
+            except Exception as exp:
+                return serial, exp
+
+        serials = list(dict.fromkeys(str(serial) for serial in serials))
+        tasks = [asyncio.ensure_future(_fetch(serial)) for serial in serials]
+        try:
+            for task in tasks if ordered else asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def register_product(
+        self, units: list[ProductRegistrationUnit], locations: list[Tuple[str, Location]] = []
+    ) -> bool:
+        """
+        Register products. See `FortiCare.register_product`.
+        :return bool: True if every unit is registered
+        """
+        body = _register_product_body(units, locations)
+        LOG.info("> Registering new product...")
+        try:
+            results = await self._post("/products/register", body)
+        except Exception as exp:
+            LOG.error(">>> Failed to register product: %s", str(exp.args))
+            raise exp
+        return _parse_register_product(units, results)
+
+    async def get_licenses(
+        self, status: str = "", license_number: str = "", license_sku: str = "", raw: bool = False
+    ) -> list[License]:
+        """
+        Get license information. See `FortiCare.get_licenses`.
+        :return list: Return a list of licenses
+        """
+        body = _licenses_body(status, license_number, license_sku)
+        LOG.info("> Getting license information...")
+        try:
+            results = await self._post("/licenses/list", body)
+        except Exception as exp:
+            LOG.error(">>> Failed to get license information: %s", str(exp.args))
+            raise exp
+        return _parse_licenses(results, raw)
+
+    async def register_licenses(self, license: LicenseRegistrationUnit, journal: RegistrationJournal = None) -> Asset:
+        """
+        Register a subscription contract (e.g. VM-S) to generate serial number.
+        :param license: License registration unit
+        :type license: LicenseRegistrationUnit
+        :param journal: Journal recording the outcome, see `FortiCare.register_licenses`
+        :type journal: RegistrationJournal
+        :return Asset: Details for registered asset
+        """
+        key = None
+        if journal is not None:
+            # SQLite calls are kept off the event loop
+            key, serial_number = await asyncio.to_thread(_begin_single_use, journal, license)
+            if serial_number:
+                LOG.info("> License already registered (journal): %s", serial_number)
+                return await self.get_product_details(serial_number)
+        LOG.info("> Registering new service...")
+        try:
+            results = await self._post("/licenses/register", license.to_json())
+        except Exception as exp:
+            LOG.error(">>> Failed to register service: %s", str(exp.args))
+            if key is not None:
+                await asyncio.to_thread(_journal_failure, journal, key, exp)
+            raise exp
+        asset = _parse_asset_details(results)
+        if key is not None:
+            await asyncio.to_thread(journal.mark_result, key, True, "", asset.serialNumber)
+        return asset
+
+    async def download_licenses(self, serial_number: str) -> str:
+        """
+        Download key license file.
+        :param serial_number: Serial number
+        :type serial_number: str
+        :return str: Return a license file
+        """
+        if self._license_store is not None:
+            license_file = await asyncio.to_thread(self._license_store.get, serial_number)
+            if license_file is not None:
+                self._metrics.incr("license_store_hits")
+                return license_file
+        LOG.info("> Downloading license file...")
+        try:
+            results = await self._post("/licenses/download", {"serialNumber": str(serial_number)})
+        except Exception as exp:
+            LOG.error(">>> Failed to download license file: %s", str(exp.args))
+            raise exp
+        license_file = _parse_license_file(results)
+        if self._license_store is not None:
+            # put takes a file lock and writes files atomically: keep it off the event loop
+            await asyncio.to_thread(self._license_store.put, serial_number, license_file)
+        return license_file
+
+    async def register_services(self, service: ServiceRegistrationUnit, journal: RegistrationJournal = None) -> Asset:
+        """
+        Register a subscription contract (e.g. VM-S) to generate serial number.
+        :param service: Service registration unit
+        :type service: ServiceRegistrationUnit
+        :param journal: Journal recording the outcome, see `FortiCare.register_services`
+        :type journal: RegistrationJournal
+        :return Asset: An assets
+        """
+        key = None
+        if journal is not None:
+            # SQLite calls are kept off the event loop
+            key, serial_number = await asyncio.to_thread(_begin_single_use, journal, service)
+            if serial_number:
+                LOG.info("> Service already registered (journal): %s", serial_number)
+                return await self.get_product_details(serial_number)
+        LOG.info("> Registering new service...")
+        try:
+            results = await self._post("/services/register", service.to_json())
+        except Exception as exp:
+            LOG.error(">>> Failed to register service: %s", str(exp.args))
+            if key is not None:
+                await asyncio.to_thread(_journal_failure, journal, key, exp)
+            raise exp
+        asset = _parse_asset_details(results)
+        if key is not None:
+            await asyncio.to_thread(journal.mark_result, key, True, "", asset.serialNumber)
+        return asset
+
+    @property
+    def token(self):
+        """Get API token"""
+        return self._token
+
+    @token.setter
+    def token(self, token):
+        """Set API token. Its expiry is unknown until the next login."""
+        self._token = token
+        self._token_expires_at = None
+        self._token_lifetime = None
+        if self._cache is not None:
+            self._cache.clear_errors()  # they may come from the previous token
+
+    @property
+    def token_expires_at(self):
+        """Get token expiry as a POSIX timestamp, None if unknown"""
+        return self._token_expires_at
+
+    @property
+    def api_user(self):
+        """Get API User"""
+        return self._api_user
+
+    @api_user.setter
+    def api_user(self, api_user):
+        """Set API User"""
+        self._api_user = api_user
+
+    @property
+    def api_key(self):
+        """Get API Key"""
+        return self._api_key
+
+    @api_key.setter
+    def api_key(self, api_key):
+        """Set API Key"""
+        self._api_key = api_key
+
+    @property
+    def auto_login(self):
+        """Get auto login"""
+        return self._auto_login
+
+    @auto_login.setter
+    def auto_login(self, auto_login):
+        """Set auto login"""
+        self._auto_login = auto_login
+
+    @property
+    def timeout(self):
+        """Get timeout"""
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, timeout):
+        """Set timeout"""
+        self._timeout = timeout
+
+    @property
+    def retry(self):
+        """Get retry policy"""
+        return self._retry
+
+    @retry.setter
+    def retry(self, retry):
+        """Set retry policy"""
+        self._retry = retry
+
+    @property
+    def rate_limiter(self):
+        """Get rate limiter"""
+        return self._rate_limiter
+
+    @rate_limiter.setter
+    def rate_limiter(self, rate_limiter):
+        """Set rate limiter"""
+        self._rate_limiter = rate_limiter
+
+    @property
+    def cache(self):
+        """Get response cache"""
+        return self._cache
+
+    @cache.setter
+    def cache(self, cache):
+        """Set response cache"""
+        self._cache = cache
+
+    @property
+    def license_store(self):
+        """Get license file store"""
+        return self._license_store
+
+    @license_store.setter
+    def license_store(self, license_store):
+        """Set license file store"""
+        self._license_store = license_store
+
+    @property
+    def metrics(self):
+        """Get request, retry and error counters"""
+        return self._metrics.snapshot()
+
+    @property
+    def debug(self):
+        """Get debug"""
+        return self._debug
+
+    @debug.setter
+    def debug(self, debug):
+        """Set debug"""
+        self._debug = debug
+
+    def __str__(self):
+        return f"AsyncFortiCare: logged with {self.api_user}"
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+"""_cache.py: Response cache for read-only FortiCare endpoints."""
+
+import copy
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Tuple
+
+__author__ = "Charles Prevot"
+__copyright__ = "Copyright 2024"
+
+
+READ_ENDPOINTS = frozenset(["/products/list", "/products/details", "/licenses/list"])
+NOT_FOUND_MESSAGES = ("not found", "invalid serial number")
+
+
+def _affected_serials(body: dict, results: dict) -> set:
+    """Collect the serial numbers touched by a registration request and its response"""
+    serials = set()
+    for data in (body, results):
+        if not isinstance(data, dict):
+            continue
+        if data.get("serialNumber"):
+            serials.add(data["serialNumber"])
+        for unit in data.get("registrationUnits") or []:
+            if unit.get("serialNumber"):
+                serials.add(unit["serialNumber"])
+        for asset in data.get("assets") or []:
+            if asset.get("serialNumber"):
+                serials.add(asset["serialNumber"])
+        if isinstance(data.get("assetDetails"), dict) and data["assetDetails"].get("serialNumber"):
+            serials.add(data["assetDetails"]["serialNumber"])
+    return serials
+
+
+class ResponseCache(object):
+    """
+    TTL + LRU cache of API responses, keyed by endpoint and canonicalized request body.
+
+    "Not found" errors can be cached too (negative caching) for a shorter time. They are told apart from
+    other errors with the same HTTP status (e.g. an invalid token) by their API error code or message.
+    Cached responses are copied in and out, so callers can't alter them.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 300,
+        endpoint_ttls: dict = None,
+        negative_ttl: float = 60,
+        negative_statuses: Iterable[int] = (400, 404),
+        negative_error_codes: Iterable[int] = (),
+        negative_messages: Iterable[str] = NOT_FOUND_MESSAGES,
+        endpoints: Iterable[str] = READ_ENDPOINTS,
+    ):
+        """
+        :param max_entries: Maximum number of cached responses, least recently used ones are evicted first
+        :type max_entries: int
+        :param ttl: Default time to live of a response, in seconds
+        :type ttl: float
+        :param endpoint_ttls: Time to live of specific endpoints, e.g. {"/products/list": 60}
+        :type endpoint_ttls: dict
+        :param negative_ttl: Time to live of a cached error, in seconds. 0 disables negative caching.
+        :type negative_ttl: float
+        :param negative_statuses: HTTP status codes of the errors to cache
+        :type negative_statuses: Iterable[int]
+        :param negative_error_codes: API error codes of the errors to cache
+        :type negative_error_codes: Iterable[int]
+        :param negative_messages: Case-insensitive parts of the API error messages of the errors to cache
+        :type negative_messages: Iterable[str]
+        :param endpoints: Endpoints to cache. Only read-only endpoints should be listed.
+        :type endpoints: Iterable[str]
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.endpoint_ttls = dict(endpoint_ttls or {})
+        self.negative_ttl = negative_ttl
+        self.negative_statuses = frozenset(negative_statuses)
+        self.negative_error_codes = frozenset(negative_error_codes)
+        self.negative_messages = tuple(message.lower() for message in negative_messages)
+        self.endpoints = frozenset(endpoints)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(endpoint: str, body: dict) -> str:
+        """Build the cache key of a request"""
+        return endpoint + json.dumps(body, sort_keys=True, separators=(",", ":"), default=str)
+
+    def is_cached(self, endpoint: str) -> bool:
+        """Check whether an endpoint is cached"""
+        return endpoint in self.endpoints
+
+    def get(self, endpoint: str, body: dict) -> Tuple[bool, dict]:
+        """
+        Look a request up. A cached error is raised again.
+        :param endpoint: API endpoint
+        :type endpoint: str
+        :param body: Request body
+        :type body: dict
+        :return tuple: Return (True, response) on hit, (False, None) on miss
+        """
+        key = self.key(endpoint, body)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if entry["expires_at"] <= time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+        if entry["error"] is not None:
+            raise copy.copy(entry["error"])
+        return True, copy.deepcopy(entry["value"])
+
+    def _store(self, endpoint: str, body: dict, ttl: float, value: dict = None, error: Exception = None) -> None:
+        if ttl <= 0:
+            return
+        key = self.key(endpoint, body)
+        entry = {
+            "expires_at": time.monotonic() + ttl,
+            "endpoint": endpoint,
+            "serial": body.get("serialNumber") if isinstance(body, dict) else None,
+            "value": copy.deepcopy(value),
+            "error": error,
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def set(self, endpoint: str, body: dict, value: dict) -> None:
+        """Cache a response"""
+        self._store(endpoint, body, self.endpoint_ttls.get(endpoint, self.ttl), value=value)
+
+    def set_error(self, endpoint: str, body: dict, error: Exception) -> None:
+        """Cache an error (e.g. serial number not found)"""
+        self._store(endpoint, body, self.negative_ttl, error=error)
+
+    def is_negative(self, error: Exception) -> bool:
+        """
+        Check whether an error is a "not found" that can be cached: its HTTP status is one of `negative_statuses`
+        and the API response has one of `negative_error_codes` or a message containing one of `negative_messages`.
+        Errors without an API response, such as token errors, are never cached.
+        :param error: Error raised by a request
+        :type error: requests.exceptions.HTTPError
+        :return bool: True if the error can be cached
+        """
+        if not error.args or error.args[0] not in self.negative_statuses:
+            return False
+        response = getattr(error, "response", None)
+        if response is None:
+            return False
+        try:
+            j_data = response.json()
+        except ValueError:
+            return False
+        if not isinstance(j_data, dict):
+            return False
+        api_error = j_data.get("error") if isinstance(j_data.get("error"), dict) else {}
+        if api_error.get("errorCode") in self.negative_error_codes:
+            return True
+        message = str(api_error.get("message") or j_data.get("message") or "").lower()
+        return any(part in message for part in self.negative_messages)
+
+    def clear_errors(self) -> None:
+        """Drop every cached error, e.g. once a new token may make them succeed"""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry["error"] is not None:
+                    del self._entries[key]
+
+    def invalidate(self, serials: Iterable[str]) -> None:
+        """
+        Drop the responses that may describe the given serial numbers: their details and every list.
+        :param serials: Serial numbers whose registration changed
+        :type serials: Iterable[str]
+        """
+        serials = set(serials)
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry["serial"] in serials or entry["endpoint"].endswith("/list"):
+                    del self._entries[key]
+
+    def clear(self) -> None:
+        """Drop every cached response"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def __str__(self) -> str:
+        return f"ResponseCache({len(self)}/{self.max_entries} entries)"
@@ -1,3 +1,11 @@
 # -*- coding: utf-8 -*-
 
 FORTICARE_URL = "https://support.fortinet.com/ES/api/registration/v3"  # fortinet support URL
+FC_OAUTH = "https://customerapiauth.fortinet.com/api/v1/oauth/token/"  # used for login only
+
+SERIAL_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"  # characters allowed in a serial number
+SERIAL_LENGTH = 16  # serial numbers are 16 characters long
+SERIAL_WILDCARD = "*"  # appended to a serial number prefix to build a search pattern
+
+# endpoints creating registrations: replaying them after the request reached the server may register twice
+NON_IDEMPOTENT_ENDPOINTS = frozenset(["/products/register", "/licenses/register", "/services/register"])
@@ -2,28 +2,29 @@
 
 """_core.py: ."""
 
-import requests
 import logging
 import json
+import threading
+import time
+import weakref
 from typing import Union
 
+from ._constants import FC_OAUTH
+
 __author__ = "Charles Prevot"
 __copyright__ = "Copyright 2024"
 
 
-FC_OAUTH = "https://customerapiauth.fortinet.com/api/v1/oauth/token/"  # used for login only
 LOG = logging.getLogger("forticare")
 
+# floor of the background refresh delay, so a token issued already expiring can't make it spin
+MIN_REFRESH_DELAY = 1.0
 
-def login(self, api_user: str = "", api_key: str = "") -> bool:
+
+def _login_body(self, api_user: str, api_key: str) -> dict:
     """
-    Retrive a new token for authentication.
-    See more: https://docs.fortinet.com/document/fortiauthenticator/6.1.2/rest-api-solution-guide/498666/oauth-server-token-oauth-token
-    :param api_user: API user to authenticate
-    :type api_user: str
-    :param api_user: API password
-    :type api_user: str
-    :return str: Return a bearer token
+    Resolve credentials (arguments take precedence over stored ones) and build the OAuth request body.
+    :return dict: Return the request body, or None if credentials are missing
     """
     if api_user == "" or api_user is None:
         api_user = self._api_user
@@ -35,18 +36,33 @@ def login(self, api_user: str = "", api_key: str = "") -> bool:
         self._api_key = api_key
     if api_user == "" or api_key == "" or api_user is None or api_key is None:
         LOG.error(">>> API user or API key is missing")
-        return False
-    body = {
+        return None
+    return {
         "username": str(api_user),
         "password": str(api_key),
         "client_id": "assetmanagement",
         "grant_type": "password",
     }
-    LOG.info("> Retrieving API Token on FortiCare")
-    results = requests.post(FC_OAUTH, json=body)
-    if results.ok:
+
+
+def _handle_login_response(self, results) -> bool:
+    """
+    Store the token from an OAuth response.
+    :param results: HTTP response
+    :type results: requests.Response or httpx.Response
+    :return bool: True if login success, False if login failed
+    """
+    if results.status_code < 400:
         j_data = json.loads(results.content)
         self.token = j_data["access_token"]
+        if j_data.get("expires_in"):
+            self._token_lifetime = float(j_data["expires_in"])
+            self._token_expires_at = time.time() + self._token_lifetime
+        if self._token_store is not None:
+            try:
+                self._token_store.save(self._api_user, self._token, self._token_expires_at)
+            except OSError as exp:
+                LOG.warning(">>> Failed to store API Token: %s", str(exp.args))
     elif results.status_code == 400 or results.status_code == 401:
         LOG.error(">>> Invalid credentials, or user improperly configured")
         return False
@@ -61,10 +77,132 @@ def login(self, api_user: str = "", api_key: str = "") -> bool:
             ">>> Error: %s\nREQUEST:\nHeaders:\n%s\nBody:\n%s\nRESPONSE:\n%s\n",
             error_description,
             results.request.headers,
-            results.request.body,
+            results.request.body if hasattr(results.request, "body") else "",
             results.content,
         )
         results.raise_for_status()  # unknown error. Raise an exception
         return False
 
     return True
+
+
+def _load_stored_token(self) -> bool:
+    """
+    Reuse a token from the token store, if one is stored for the API user and not about to expire.
+    :return bool: True if a token was loaded
+    """
+    if self._token_store is None or not self._api_user:
+        return False
+    try:
+        stored = self._token_store.load(self._api_user)
+    except OSError as exp:
+        LOG.warning(">>> Failed to load API Token: %s", str(exp.args))
+        return False
+    if stored is None:
+        return False
+    token, expires_at = stored
+    if expires_at is not None and time.time() >= expires_at - self._refresh_margin:
+        return False
+    LOG.debug("> Reusing stored API Token")
+    self._token = token
+    self._token_expires_at = expires_at
+    return True
+
+
+def login(self, api_user: str = "", api_key: str = "") -> bool:
+    """
+    Retrive a new token for authentication.
+    See more: https://docs.fortinet.com/document/fortiauthenticator/6.1.2/rest-api-solution-guide/498666/oauth-server-token-oauth-token
+    :param api_user: API user to authenticate
+    :type api_user: str
+    :param api_user: API password
+    :type api_user: str
+    :return str: Return a bearer token
+    """
+    with self._token_lock:
+        body = _login_body(self, api_user, api_key)
+        if body is None:
+            return False
+        LOG.info("> Retrieving API Token on FortiCare")
+        self._metrics.incr("logins")
+        results = self._session.post(FC_OAUTH, json=body, timeout=self.timeout)
+        if not _handle_login_response(self, results):
+            return False
+        _schedule_refresh(self)
+    return True
+
+
+def _effective_refresh_margin(self) -> float:
+    """
+    Get the refresh margin, capped at half the token lifetime: a token living less than `refresh_margin`
+    would otherwise be due for refresh as soon as it is issued, and every login would trigger the next one.
+    """
+    if self._token_lifetime is None:
+        return self._refresh_margin
+    return min(self._refresh_margin, self._token_lifetime / 2)
+
+
+def _token_expiring(self) -> bool:
+    """Check whether the token expires within the refresh margin"""
+    expires_at = self._token_expires_at
+    return expires_at is not None and time.time() >= expires_at - _effective_refresh_margin(self)
+
+
+def _refresh_token(self, stale_token: str) -> bool:
+    """
+    Log in again, unless another thread already replaced the stale token while we waited.
+    Only one login is in flight at a time, other callers wait for it and reuse its token.
+    :param stale_token: Token known to be missing, expired or rejected
+    :type stale_token: str
+    :return bool: True if a valid token is available
+    """
+    with self._token_lock:
+        if self.token and self.token != stale_token and not _token_expiring(self):
+            return True
+        return self.login()
+
+
+def _ensure_token(self) -> str:
+    """
+    Get a token usable for the next request, logging in first if it is missing or about to expire.
+    :return str: Return the token
+    """
+    token = self.token
+    if token and not _token_expiring(self):
+        return token
+    if not self._auto_login:
+        if token:
+            return token  # let the API tell whether it is still valid
+        raise ValueError("Token is missing. Please login first.")
+    _refresh_token(self, token)
+    return self.token
+
+
+def _proactive_refresh(client_ref: weakref.ref) -> None:
+    """Timer callback refreshing the token before it expires"""
+    self = client_ref()
+    if self is None:
+        return
+    LOG.debug("> Refreshing API Token before expiry")
+    try:
+        _refresh_token(self, self.token)
+    except Exception as exp:
+        LOG.error(">>> Failed to refresh API Token: %s", str(exp.args))
+
+
+def _schedule_refresh(self) -> None:
+    """Schedule a background token refresh `refresh_margin` seconds before expiry, half-way for short-lived tokens"""
+    _cancel_refresh(self)
+    if not self._auto_login or not self._proactive_refresh or self._token_expires_at is None:
+        return
+    delay = max(MIN_REFRESH_DELAY, self._token_expires_at - _effective_refresh_margin(self) - time.time())
+    self._refresh_timer = threading.Timer(delay, _proactive_refresh, args=(weakref.ref(self),))
+    self._refresh_timer.daemon = True
+    self._refresh_timer.start()
+
+
+def _cancel_refresh(self) -> None:
+    """Cancel the scheduled token refresh"""
+    if self._refresh_timer is not None:
+        self._refresh_timer.cancel()
+        self._refresh_timer = None
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+"""_expiry_index.py: Sorted index of entitlement and warranty end dates."""
+
+from bisect import bisect_left, insort
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, Tuple
+
+from .asset import Asset, Service
+
+__author__ = "Charles Prevot"
+__copyright__ = "Copyright 2024"
+
+
+def _naive_utc(date: datetime) -> datetime:
+    """Convert a datetime to naive UTC so dates with and without an offset compare, naive datetimes are taken as UTC"""
+    if date is not None and date.tzinfo is not None:
+        return date.astimezone(timezone.utc).replace(tzinfo=None)
+    return date
+
+
+class ExpiryIndex(object):
+    """
+    In-memory index of the entitlements and warranty supports of many assets, sorted by end date.
+
+    Range queries bisect sorted lists of (endDate, serial number, position) keys, one for every service
+    and one per service type and per service level. End dates and bounds are compared as naive UTC
+    datetimes. Adding an asset already indexed replaces its services, so the index can be refreshed
+    asset by asset.
+    """
+
+    def __init__(self, assets: Iterable[Asset] = ()):
+        """
+        :param assets: Assets to index
+        :type assets: Iterable[Asset]
+        """
+        self._keys = []
+        self._by_type = {}
+        self._by_level = {}
+        self._services = {}  # key -> (service, warranty)
+        self._by_serial = {}  # serial number -> keys
+        self.update(assets)
+
+    def add(self, asset: Asset) -> None:
+        """
+        Index the entitlements and warranty supports of an asset, replacing those indexed before.
+        :param asset: Asset
+        :type asset: Asset
+        """
+        self.remove(asset.serialNumber)
+        keys = []
+        services = [(service, False) for service in asset.entitlements]
+        services += [(service, True) for service in asset.warrantySupports]
+        for position, (service, warranty) in enumerate(services):
+            key = (_naive_utc(service.endDate), asset.serialNumber, position)
+            insort(self._keys, key)
+            insort(self._by_type.setdefault(service.type, []), key)
+            insort(self._by_level.setdefault(service.level, []), key)
+            self._services[key] = (service, warranty)
+            keys.append(key)
+        self._by_serial[asset.serialNumber] = keys
+
+    def update(self, assets: Iterable[Asset]) -> None:
+        """Index many assets"""
+        for asset in assets:
+            self.add(asset)
+
+    @staticmethod
+    def _discard(keys: list, key: tuple) -> None:
+        index = bisect_left(keys, key)
+        if index < len(keys) and keys[index] == key:
+            del keys[index]
+
+    def remove(self, serial_number: str) -> None:
+        """Drop the services of an asset from the index, if indexed"""
+        for key in self._by_serial.pop(serial_number, []):
+            service, _ = self._services.pop(key)
+            self._discard(self._keys, key)
+            for index, value in ((self._by_type, service.type), (self._by_level, service.level)):
+                self._discard(index[value], key)
+                if not index[value]:
+                    del index[value]
+
+    def entries(
+        self,
+        before: datetime = None,
+        after: datetime = None,
+        type: int = None,
+        level: int = None,
+        warranty: bool = None,
+    ) -> Iterator[Tuple[datetime, str, Service]]:
+        """
+        Iterate over the services ending in [after, before), by end date.
+        :param before: Upper bound, excluded. None for no bound.
+        :type before: datetime
+        :param after: Lower bound, included. None for no bound.
+        :type after: datetime
+        :param type: Only services of this type, as returned by the API (e.g. 11)
+        :type type: int
+        :param level: Only services of this level, as returned by the API (e.g. 20)
+        :type level: int
+        :param warranty: Only warranty supports if True, only entitlements if False
+        :type warranty: bool
+        :return Iterator: Yield (end date as naive UTC, serial number, service) tuples
+        """
+        if type is not None:
+            keys = self._by_type.get(type, [])
+        elif level is not None:
+            keys = self._by_level.get(level, [])
+        else:
+            keys = self._keys
+        after, before = _naive_utc(after), _naive_utc(before)
+        # (date,) sorts before every key of that date, so it works as a bound of both ends
+        start = bisect_left(keys, (after,)) if after is not None else 0
+        stop = bisect_left(keys, (before,)) if before is not None else len(keys)
+        for index in range(start, stop):
+            key = keys[index]
+            service, is_warranty = self._services[key]
+            if level is not None and service.level != level:
+                continue
+            if warranty is not None and is_warranty != warranty:
+                continue
+            yield key[0], key[1], service
+
+    def serials(
+        self,
+        before: datetime = None,
+        after: datetime = None,
+        type: int = None,
+        level: int = None,
+        warranty: bool = None,
+    ) -> list[str]:
+        """
+        Get the serial numbers of the assets owning a service ending in [after, before).
+        Same filters as `entries`.
+        :return list: Return serial numbers, ordered by earliest matching end date
+        """
+        return list(dict.fromkeys(serial for _, serial, _ in self.entries(before, after, type, level, warranty)))
+
+    def __contains__(self, serial_number: str) -> bool:
+        return serial_number in self._by_serial
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __str__(self) -> str:
+        return f"ExpiryIndex({len(self._by_serial)} assets, {len(self._keys)} services)"
+
+    def __repr__(self) -> str:
+        return self.__str__()
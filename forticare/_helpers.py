@@ -5,7 +5,14 @@ import logging
 import os
 import platform
 import requests
+import time
+import copy
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Callable, Iterable, Iterator, Tuple
 from ._constants import *
+from ._cache import ResponseCache, _affected_serials
+from ._core import _ensure_token, _refresh_token
+from .asset import Asset
 from logging.handlers import RotatingFileHandler
 
 __author__ = "Charles Prevot"
@@ -51,6 +58,30 @@ def init_logging(logger, log_level_console=logging.INFO):
     logger.addHandler(stream_handler)
 
 
+def _map_concurrent(func: Callable, items: Iterable, max_workers: int = 8, ordered: bool = True) -> Iterator[Tuple]:
+    """
+    Call `func` on every item from a thread pool.
+    Failures are yielded instead of raised so one bad item does not abort the batch.
+    :param func: Function called with one item
+    :type func: Callable
+    :param items: Items to process
+    :type items: Iterable
+    :param max_workers: Maximum number of concurrent calls
+    :type max_workers: int
+    :param ordered: Yield in input order, otherwise as soon as each call completes
+    :type ordered: bool
+    :return Iterator: Yield (item, result or exception) tuples
+    """
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {executor.submit(func, item): item for item in items}
+        for future in futures if ordered else as_completed(futures):
+            exp = future.exception()
+            yield futures[future], exp if exp is not None else future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
 # Error message example:
 # HTTP 400 Bad Request
 # Body:
@@ -99,23 +130,10 @@ def init_logging(logger, log_level_console=logging.INFO):
 #     "version": "3.0",
 #     "assetDetails": null
 # }
-def _post(self, endpoint: str, body: dict = {}) -> dict:
-    url = FORTICARE_URL + endpoint
-
-    if self.token is None or self.token == "":
-        if self._auto_login:
-            self.login()
-        else:
-            raise ValueError("Token is missing. Please login first.")
-    j_data = {}
-    results = requests.post(url, headers={"Authorization": f"Bearer {self.token}"}, json=body, timeout=self.timeout)
-    print(results)
-    j_data = results.json()
-    if results.ok:
-        return j_data
-    # refresh token
-    elif (
-        (results.status_code == 400 or results.status_code == 401 or results.status_code == 403)
+def _is_token_error(status_code: int, j_data: dict) -> bool:
+    """Check whether an API response reports a missing, invalid or expired token"""
+    return (
+        (status_code == 400 or status_code == 401 or status_code == 403)
         and j_data
         and "error" in j_data
         and j_data["error"]
@@ -125,31 +143,185 @@ def _post(self, endpoint: str, body: dict = {}) -> dict:
             or j_data["error"]["message"] == "Access denied. No permission to access the requested action or resource."
             or j_data["error"]["message"] == "Please provide token in request."
         )
-    ):
-        if self._auto_login:
-            if self.login():
-                return self._post(endpoint, body)
+    )
+
+
+def _raise_for_error(endpoint: str, results, j_data: dict) -> None:
+    """
+    Raise an exception describing a failed API call.
+    :param endpoint: API endpoint
+    :type endpoint: str
+    :param results: HTTP response
+    :type results: requests.Response or httpx.Response
+    :param j_data: Decoded response body
+    :type j_data: dict
+    """
+    LOG.debug(
+        ">>> Error:\nREQUEST:\n%s\n%s\nRESPONSE:\n%s\n",
+        str(results.request.headers),
+        str(results.request.body if hasattr(results.request, "body") else ""),
+        str(results.content),
+    )
+    if j_data and "error" in j_data and j_data["error"] and "message" in j_data["error"]:
+        _msg = f"POST {endpoint} "
+        if j_data["error"]["message"] == "Failed":
+            for index, asset in enumerate(j_data["assets"]):
+                _msg += f"{asset['serialNumber']} | {asset['message']}"
+                if index < len(j_data["assets"]) - 1:
+                    _msg += ", "
         else:
-            raise requests.exceptions.HTTPError(results.status_code, f"POST {endpoint} {j_data['error']['message']}")
-    else:
-        LOG.debug(
-            ">>> Error:\nREQUEST:\n%s\n%s\nRESPONSE:\n%s\n",
-            str(results.request.headers),
-            str(results.request.body if hasattr(results.request, "body") else ""),
-            str(results.content),
+            _msg += j_data["error"]["message"]
+        raise requests.exceptions.HTTPError(results.status_code, _msg, response=results)
+    elif j_data and "message" in j_data:
+        raise requests.exceptions.HTTPError(
+            results.status_code, f"POST {endpoint} {j_data['message']}", response=results
         )
-        if j_data and "error" in j_data and "message" in j_data["error"]:
-            _msg = f"POST {endpoint} "
-            if j_data["error"]["message"] == "Failed":
-                for index, asset in enumerate(j_data["assets"]):
-                    _msg += f"{asset['serialNumber']} | {asset['message']}"
-                    if index < len(j_data["assets"]) - 1:
-                        _msg += ", "
-            else:
-                _msg += j_data["error"]["message"]
-            raise requests.exceptions.HTTPError(results.status_code, _msg)
-        elif j_data and "message" in j_data:
-            raise requests.exceptions.HTTPError(results.status_code, f"POST {endpoint} {j_data['message']}")
+    else:
+        results.raise_for_status()  # unknown error. Raise an exception
+
+
+def _is_rejection(exp: Exception) -> bool:
+    """
+    Tell whether a failed call was rejected by the API, as opposed to failing with an unknown outcome
+    (transport error, timeout, server error) after which the request may still have gone through.
+    :param exp: Exception raised by the call
+    :type exp: Exception
+    :return bool: True if the API answered with an error body, below HTTP 500
+    """
+    if not isinstance(exp, requests.exceptions.HTTPError) or exp.response is None:
+        return False
+    if exp.response.status_code >= 500:
+        return False
+    try:
+        j_data = exp.response.json()
+    except ValueError:
+        return False
+    return isinstance(j_data, dict) and bool(j_data.get("error") or j_data.get("message"))
+
+
+def _parse_asset_details(results: dict, raw: bool = False) -> Asset:
+    """Build an asset from an `assetDetails` response, or return its JSON object if `raw`"""
+    if isinstance(results, dict) and "assetDetails" in results:
+        return results["assetDetails"] if raw else Asset(results["assetDetails"])
+    raise Exception("Inexpected response from API:/n%s", results)
+
+
+def _wait_before_retry(self, endpoint: str, attempt: int, reason: str, retry_after: str = None) -> None:
+    """Count a retry and sleep for the backoff delay"""
+    delay = self._retry.backoff(attempt, retry_after)
+    LOG.warning("> POST %s failed (%s), retrying in %.2fs (attempt %d)", endpoint, reason, delay, attempt + 1)
+    self._metrics.incr("retries")
+    self._metrics.incr(f"retries:{endpoint}")
+    time.sleep(delay)
+
+
+def _send(self, endpoint: str, body: dict) -> dict:
+    """Send a request to FortiCare, handling token refresh, rate limiting and retries"""
+    url = FORTICARE_URL + endpoint
+
+    token = _ensure_token(self)
+    attempt = 0
+    relogged = False
+    while True:
+        attempt += 1
+        if self._rate_limiter is not None and self._rate_limiter.acquire(endpoint) > 0:
+            self._metrics.incr("rate_limited")
+        self._metrics.incr("requests")
+        try:
+            results = self._session.post(
+                url, headers={"Authorization": f"Bearer {token}"}, json=body, timeout=self.timeout
+            )
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as exp:
+            # a connect timeout means the request never reached the server
+            sent = not isinstance(exp, requests.exceptions.ConnectTimeout)
+            if not self._retry.should_retry(endpoint, attempt, sent=sent):
+                self._metrics.incr("errors")
+                raise exp
+            _wait_before_retry(self, endpoint, attempt, type(exp).__name__)
+            continue
+        LOG.debug("POST %s: HTTP %s", endpoint, results.status_code)
+        if self._rate_limiter is not None:
+            if results.status_code == 429:
+                self._metrics.incr("throttled")
+                self._rate_limiter.on_throttled(endpoint)
+            elif results.ok:
+                self._rate_limiter.on_success(endpoint)
+        if self._retry.should_retry(endpoint, attempt, status_code=results.status_code):
+            _wait_before_retry(
+                self, endpoint, attempt, f"HTTP {results.status_code}", results.headers.get("Retry-After")
+            )
+            continue
+
+        try:
+            j_data = results.json()
+        except ValueError:
+            if results.ok:
+                raise
+            j_data = {}
+        if results.ok:
+            return j_data
+        self._metrics.incr("errors")
+        # refresh token, once per call
+        if _is_token_error(results.status_code, j_data):
+            if self._auto_login and not relogged and _refresh_token(self, token):
+                relogged = True
+                token = self.token
+                continue
+            raise requests.exceptions.HTTPError(results.status_code, f"POST {endpoint} {j_data['error']['message']}")
+        _raise_for_error(endpoint, results, j_data)
+        return j_data
+
+
+def _send_coalesced(self, endpoint: str, body: dict) -> dict:
+    """
+    Send a request, sharing one in-flight call between concurrent identical read requests (single-flight).
+    Registration endpoints are never coalesced.
+    """
+    if not self._coalesce or endpoint in NON_IDEMPOTENT_ENDPOINTS:
+        return _send(self, endpoint, body)
+    key = ResponseCache.key(endpoint, body)
+    with self._inflight_lock:
+        inflight = self._inflight.get(key)  # [future, number of followers]
+        leader = inflight is None
+        if leader:
+            inflight = self._inflight[key] = [Future(), 0]
         else:
-            results.raise_for_status()  # unknown error. Raise an exception
+            inflight[1] += 1
+    future = inflight[0]
+    if not leader:
+        self._metrics.incr("coalesced")
+        return copy.deepcopy(future.result())
+    try:
+        j_data = _send(self, endpoint, body)
+    except BaseException as exp:
+        with self._inflight_lock:
+            del self._inflight[key]
+        future.set_exception(exp)
+        raise
+    with self._inflight_lock:
+        del self._inflight[key]
+        shared = inflight[1] > 0
+    future.set_result(j_data)
+    # followers copy the shared response, the leader gets its own copy too so callers can't see each other's changes
+    return copy.deepcopy(j_data) if shared else j_data
+
+
+def _post(self, endpoint: str, body: dict = {}) -> dict:
+    cache = self._cache if self._cache is not None and self._cache.is_cached(endpoint) else None
+    if cache is not None:
+        hit, j_data = cache.get(endpoint, body)
+        if hit:
+            self._metrics.incr("cache_hits")
+            return j_data
+        self._metrics.incr("cache_misses")
+    try:
+        j_data = _send_coalesced(self, endpoint, body)
+    except requests.exceptions.HTTPError as exp:
+        if cache is not None and cache.is_negative(exp):
+            cache.set_error(endpoint, body, exp)
+        raise exp
+    if cache is not None:
+        cache.set(endpoint, body, j_data)
+    elif self._cache is not None and endpoint in NON_IDEMPOTENT_ENDPOINTS:
+        self._cache.invalidate(_affected_serials(body, j_data))
     return j_data
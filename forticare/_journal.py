@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+"""_journal.py: Durable journal of bulk registrations."""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Iterable, Tuple
+
+from ._helpers import _is_rejection
+from .registration_unit import LicenseRegistrationUnit, ProductRegistrationUnit, ServiceRegistrationUnit
+
+__author__ = "Charles Prevot"
+__copyright__ = "Copyright 2024"
+
+LOG = logging.getLogger("forticare")
+
+
+PENDING = "pending"  # recorded, never sent
+SUBMITTED = "submitted"  # sent, outcome unknown (e.g. the process died waiting for the response)
+REGISTERED = "registered"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS registrations (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL,
+    message TEXT NOT NULL DEFAULT '',
+    serial_number TEXT NOT NULL DEFAULT '',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+def unit_key(unit) -> str:
+    """
+    Build the journal key of a registration unit: what makes two registrations the same.
+    :param unit: Registration unit
+    :type unit: ProductRegistrationUnit, LicenseRegistrationUnit or ServiceRegistrationUnit
+    :return str: Return the key
+    """
+    if isinstance(unit, ProductRegistrationUnit):
+        return f"product:{unit.serialNumber}"
+    if isinstance(unit, LicenseRegistrationUnit):
+        # a registration code can only be used once
+        if unit.licenseRegistrationCode:
+            return f"license:{unit.licenseRegistrationCode}"
+        # without a code, only the whole request body tells two units apart
+        body = json.dumps(unit.to_json(), sort_keys=True).encode("utf-8")
+        return f"license:sha256:{hashlib.sha256(body).hexdigest()}"
+    if isinstance(unit, ServiceRegistrationUnit):
+        return f"service:{unit.contractNumber}"
+    raise ValueError(f"Unsupported registration unit: {unit}")
+
+
+def _begin_single_use(journal, unit) -> Tuple[str, str]:
+    """
+    Record a license or service unit before it is sent.
+    Its code or contract is accepted only once and can't be looked up, so a unit sent by a previous run
+    without a known outcome raises for manual review instead of being sent again.
+    :param journal: Journal
+    :type journal: RegistrationJournal
+    :param unit: Registration unit
+    :type unit: LicenseRegistrationUnit or ServiceRegistrationUnit
+    :return tuple: Return (journal key, serial number if the unit is already registered, else "")
+    """
+    key = journal.record([unit])[0]
+    entry = journal.get(key)
+    if entry["state"] == REGISTERED and entry["serial_number"]:
+        return key, entry["serial_number"]
+    if entry["state"] == SUBMITTED:
+        raise Exception(
+            f"{key} was submitted by a previous run without a known outcome. "
+            "Check it in FortiCare, then record it with RegistrationJournal.mark_result"
+        )
+    journal.mark_submitted([key])
+    return key, ""
+
+
+def _journal_failure(journal, key: str, exp: Exception) -> None:
+    """
+    Record a failed license or service registration. Only a rejection by the API is final: after a
+    transport error or a server error the unit stays submitted, its registration may have gone through.
+    """
+    if _is_rejection(exp):
+        journal.mark_result(key, False, str(exp.args[-1]) if exp.args else repr(exp))
+    else:
+        LOG.warning(">>> Outcome of %s unknown, left submitted in the journal", key)
+
+
+class RegistrationJournal(object):
+    """
+    SQLite journal recording the intent, submission and outcome of each registration unit.
+
+    A bulk registration given a journal skips units already registered by a previous run, so an
+    interrupted run can simply be started again with the same input.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: SQLite database file, created if missing
+        :type path: str
+        """
+        self._path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(_SCHEMA)
+
+    @property
+    def path(self) -> str:
+        """Get database file path"""
+        return self._path
+
+    def record(self, units: Iterable) -> list[str]:
+        """
+        Record the intent to register units. Units already journaled keep their state.
+        :param units: Registration units
+        :type units: Iterable
+        :return list: Return the journal key of each unit
+        """
+        now = time.time()
+        rows = []
+        for unit in units:
+            key = unit_key(unit)
+            rows.append((key, key.split(":", 1)[0], json.dumps(unit.to_json(), sort_keys=True), PENDING, now))
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO registrations (key, kind, payload, state, updated_at) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+        return [row[0] for row in rows]
+
+    def mark_submitted(self, keys: Iterable[str]) -> None:
+        """Record that units are about to be sent"""
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE registrations SET state = ?, attempts = attempts + 1, updated_at = ? WHERE key = ?",
+                [(SUBMITTED, now, key) for key in keys],
+            )
+
+    def mark_result(self, key: str, registered: bool, message: str = "", serial_number: str = "") -> None:
+        """
+        Record the outcome of a unit.
+        :param key: Journal key
+        :type key: str
+        :param registered: Whether the unit is registered
+        :type registered: bool
+        :param message: API message
+        :type message: str
+        :param serial_number: Serial number of the registered asset
+        :type serial_number: str
+        """
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE registrations SET state = ?, message = ?, serial_number = ?, updated_at = ? WHERE key = ?",
+                (REGISTERED if registered else FAILED, message or "", serial_number or "", time.time(), key),
+            )
+
+    def get(self, key: str) -> dict:
+        """
+        Get the journal entry of a unit.
+        :return dict: Return the entry, or None if the unit was never recorded
+        """
+        with self._lock:
+            row = self._db.execute("SELECT * FROM registrations WHERE key = ?", (key,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def states(self, keys: Iterable[str]) -> dict:
+        """
+        Get the state of many units.
+        :return dict: Return states by journal key, units never recorded are missing
+        """
+        keys = list(keys)
+        states = {}
+        with self._lock:
+            # stay below SQLite's limit on the number of bound parameters
+            for index in range(0, len(keys), 500):
+                chunk = keys[index : index + 500]
+                query = "SELECT key, state FROM registrations WHERE key IN (%s)" % ",".join("?" * len(chunk))
+                states.update({row["key"]: row["state"] for row in self._db.execute(query, chunk)})
+        return states
+
+    def entries(self, state: str = None) -> list[dict]:
+        """Get every journal entry, optionally only those in a given state"""
+        with self._lock:
+            if state is None:
+                rows = self._db.execute("SELECT * FROM registrations ORDER BY rowid").fetchall()
+            else:
+                rows = self._db.execute(
+                    "SELECT * FROM registrations WHERE state = ? ORDER BY rowid", (state,)
+                ).fetchall()
+        return [dict(row) for row in rows]
+
+    def summary(self) -> dict:
+        """Count units by state"""
+        with self._lock:
+            rows = self._db.execute("SELECT state, COUNT(*) AS count FROM registrations GROUP BY state").fetchall()
+        return {row["state"]: row["count"] for row in rows}
+
+    def close(self) -> None:
+        """Close the database"""
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __str__(self) -> str:
+        return f"RegistrationJournal({self._path})"
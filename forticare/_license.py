@@ -3,12 +3,21 @@
 """_product.py: ."""
 
 from ._helpers import *
+from ._helpers import _parse_asset_details, _map_concurrent
 import uuid
+import hashlib
+import json
 import logging
+import os
+import tempfile
+import time
 from datetime import datetime
+from typing import Iterable, Tuple, Union
 
 from .asset import Asset, Service, License
 from .registration_unit import LicenseRegistrationUnit
+from ._journal import RegistrationJournal, _begin_single_use, _journal_failure
+from ._license_store import _license_file_name
 
 __author__ = "Charles Prevot"
 __copyright__ = "Copyright 2024"
@@ -16,12 +25,42 @@ __copyright__ = "Copyright 2024"
 LOG = logging.getLogger("forticare")
 
 
+def _licenses_body(status: str, license_number: str, license_sku: str) -> dict:
+    """Build a `/licenses/list` request body"""
+    body = {}
+    if status != "":
+        body["status"] = str(status)
+    if license_number != "":
+        body["licenseNumber"] = str(license_number)
+    if license_sku != "":
+        body["licenseSKU"] = str(license_sku)
+    return body
+
+
+def _parse_licenses(results: dict, raw: bool = False) -> list[License]:
+    """Build licenses from a `/licenses/list` response, or return their JSON objects if `raw`"""
+    if isinstance(results, dict) and "licenses" in results:
+        if raw:
+            return results["licenses"] or []
+        return [License(_l) for _l in results["licenses"] or []]
+    raise Exception("Inexpected response from API:/n%s", results)
+
+
+def _parse_license_file(results: dict) -> str:
+    """Extract the license file from a `/licenses/download` response"""
+    if isinstance(results, dict) and "licenseFile" in results:
+        return results["licenseFile"]
+    raise Exception("Inexpected response from API:/n%s", results)
+
+
 # {
 #   "status": "Registered"
 #   "licenseNumber": "FMCLD4713562246",
 #   "licenseSKU": "FMG-VM-CLOUD",
 # }
-def get_licenses(self, status: str = "", license_number: str = "", license_sku: str = "") -> list[License]:
+def get_licenses(
+    self, status: str = "", license_number: str = "", license_sku: str = "", raw: bool = False
+) -> list[License]:
     """
     Get license information.
     :param status: License status. Registered, Pending, Expired, or Decommissioned
@@ -30,16 +69,12 @@ def get_licenses(self, status: str = "", license_number: str = "", license_sku:
     :type license_number: str
     :param license_sku: License SKU
     :type license_sku: str
+    :param raw: Return the JSON objects of the API response instead of License objects
+    :type raw: bool
     :return list: Return a list of assets
     """
     endpoint = "/licenses/list"
-    body = {}
-    if status != "":
-        body["status"] = str(status)
-    if license_number != "":
-        body["licenseNumber"] = str(license_number)
-    if license_sku != "":
-        body["licenseSKU"] = str(license_sku)
+    body = _licenses_body(status, license_number, license_sku)
 
     LOG.info("> Getting license information...")
     results = {}
@@ -49,9 +84,7 @@ def get_licenses(self, status: str = "", license_number: str = "", license_sku:
         LOG.error(">>> Failed to get license information: %s", str(exp.args))
         raise exp
 
-    if isinstance(results, dict) and "licenses" in results:
-        return [License(_l) for _l in results["licenses"]]
-    raise Exception("Inexpected response from API:/n%s", results)
+    return _parse_licenses(results, raw)
 
 
 # Request body example:
@@ -61,32 +94,69 @@ def get_licenses(self, status: str = "", license_number: str = "", license_sku:
 #   "additionalInfo": "",
 #   "isGovernment": false
 # }
-def register_licenses(self, license: LicenseRegistrationUnit) -> Asset:
+def register_licenses(self, license: LicenseRegistrationUnit, journal: RegistrationJournal = None) -> Asset:
     """
     Register a subscription contract (e.g. VM-S) to generate serial number.
     :param license: License registration unit
     :type license: LicenseRegistrationUnit
+    :param journal: Journal recording the outcome. A code already registered in the journal is not submitted again,
+        one submitted without a known outcome (e.g. a timeout) raises.
+    :type journal: RegistrationJournal
     :return Asset: Details for registered asset
     """
     endpoint = "/licenses/register"
     body = license.to_json()
 
+    key = None
+    if journal is not None:
+        key, serial_number = _begin_single_use(journal, license)
+        if serial_number:
+            LOG.info("> License already registered (journal): %s", serial_number)
+            return self.get_product_details(serial_number)
+
     LOG.info("> Registering new service...")
     results = {}
     try:
         results: dict = self._post(endpoint, body)
     except Exception as exp:
         LOG.error(">>> Failed to register service: %s", str(exp.args))
+        if key is not None:
+            _journal_failure(journal, key, exp)
         raise exp
 
-    if isinstance(results, dict) and "assetDetails" in results:
-        return Asset(results["assetDetails"])
-    raise Exception("Inexpected response from API:/n%s", results)
+    asset = _parse_asset_details(results)
+    if key is not None:
+        journal.mark_result(key, True, "", asset.serialNumber)
+    return asset
+
+
+def register_licenses_bulk(
+    self, licenses: Iterable[LicenseRegistrationUnit], max_workers: int = 4, journal: RegistrationJournal = None
+) -> list[Tuple[LicenseRegistrationUnit, Union[Asset, Exception]]]:
+    """
+    Register many license codes concurrently.
+    Duplicate units are registered once. A failed registration is returned with its exception
+    and does not abort the batch.
+    :param licenses: License registration units
+    :type licenses: Iterable[LicenseRegistrationUnit]
+    :param max_workers: Maximum number of concurrent requests
+    :type max_workers: int
+    :param journal: Journal recording the outcome of each unit
+    :type journal: RegistrationJournal
+    :return list: Return (unit, registered asset or exception) tuples, in input order
+    """
+    licenses = list(licenses)
+    unique = list(dict.fromkeys(licenses))
+    LOG.info("> Registering %d licenses...", len(unique))
+    outcome = dict(
+        _map_concurrent(lambda license: self.register_licenses(license, journal=journal), unique, max_workers)
+    )
+    return [(license, outcome[license]) for license in licenses]
 
 
 def download_licenses(self, serial_number: str) -> str:
     """
-    Download key license file.
+    Download key license file. With a license store, a fresh stored file is returned without calling the API.
     :param serial_number: Serial number
     :type serial_number: str
     :return str: Return a license file
@@ -94,6 +164,12 @@ def download_licenses(self, serial_number: str) -> str:
     endpoint = "/licenses/download"
     body = {"serialNumber": str(serial_number)}
 
+    if self._license_store is not None:
+        license_file = self._license_store.get(serial_number)
+        if license_file is not None:
+            self._metrics.incr("license_store_hits")
+            return license_file
+
     LOG.info("> Downloading license file...")
     results = {}
     try:
@@ -102,6 +178,106 @@ def download_licenses(self, serial_number: str) -> str:
         LOG.error(">>> Failed to download license file: %s", str(exp.args))
         raise exp
 
-    if isinstance(results, dict) and "licenseFile" in results:
-        return results["licenseFile"]
-    raise Exception("Inexpected response from API:/n%s", results)
+    license_file = _parse_license_file(results)
+    if self._license_store is not None:
+        self._license_store.put(serial_number, license_file)
+    return license_file
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    """Write a file through a temporary file swapped in place, so readers never see a partial file"""
+    _fd, _tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix="." + os.path.basename(path))
+    try:
+        with os.fdopen(_fd, "wb") as _f:
+            _f.write(data)
+        os.replace(_tmp, path)
+    except Exception:
+        os.unlink(_tmp)
+        raise
+
+
+def _file_sha256(path: str) -> str:
+    """Hash a file in chunks, return None if it does not exist"""
+    sha = hashlib.sha256()
+    try:
+        with open(path, "rb") as _f:
+            for block in iter(lambda: _f.read(65536), b""):
+                sha.update(block)
+    except FileNotFoundError:
+        return None
+    return sha.hexdigest()
+
+
+def _download_license_to(self, serial_number: str, dest_dir: str, known_sha256: str = None) -> dict:
+    """
+    Download one license file to disk. Never raises.
+    :return dict: Return the manifest entry of the license file
+    """
+    path = os.path.join(dest_dir, _license_file_name(serial_number))
+    entry = {"serialNumber": serial_number, "path": path, "sha256": "", "status": "", "error": ""}
+    try:
+        if known_sha256 is not None and _file_sha256(path) == known_sha256:
+            entry.update(sha256=known_sha256, status="skipped")
+            return entry
+        content = self.download_licenses(serial_number).encode("utf-8")
+        entry["sha256"] = hashlib.sha256(content).hexdigest()
+        if _file_sha256(path) == entry["sha256"]:
+            entry["status"] = "unchanged"
+        else:
+            _write_atomic(path, content)
+            entry["status"] = "downloaded"
+    except Exception as exp:
+        entry.update(status="failed", error=str(exp.args[-1]) if exp.args else repr(exp))
+    return entry
+
+
+def download_licenses_bulk(
+    self, serials: Iterable[str], dest_dir: str, max_workers: int = 8, overwrite: bool = False
+) -> list[dict]:
+    """
+    Download many license files concurrently, each written to `<dest_dir>/<serial>.lic`.
+    Files are written atomically and only when their content changed. A `manifest.json` keeps the
+    SHA-256 of each file, so files already downloaded and left untouched are skipped on the next run.
+    A failed download does not abort the batch.
+    :param serials: Serial numbers
+    :type serials: Iterable[str]
+    :param dest_dir: Destination directory, created if missing
+    :type dest_dir: str
+    :param max_workers: Maximum number of concurrent downloads
+    :type max_workers: int
+    :param overwrite: Download files listed in the manifest again
+    :type overwrite: bool
+    :return list: Return manifest entries in input order, status is downloaded, unchanged, skipped or failed
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    manifest_path = os.path.join(dest_dir, "manifest.json")
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as _f:
+            manifest = json.load(_f)
+    except FileNotFoundError:
+        manifest = {}
+    except ValueError:
+        LOG.warning(">>> Ignoring corrupted manifest %s", manifest_path)
+        manifest = {}
+
+    serials = list(dict.fromkeys(str(serial) for serial in serials))
+    LOG.info("> Downloading %d license files...", len(serials))
+
+    def _download(serial_number: str) -> dict:
+        known = None if overwrite else (manifest.get(serial_number) or {}).get("sha256")
+        return _download_license_to(self, serial_number, dest_dir, known)
+
+    entries = [entry for _, entry in _map_concurrent(_download, serials, max_workers)]
+    now = time.time()
+    for entry in entries:
+        if entry["status"] in ("downloaded", "unchanged"):
+            manifest[entry["serialNumber"]] = {
+                "file": os.path.basename(entry["path"]),
+                "sha256": entry["sha256"],
+                "fetched_at": now,
+            }
+    _write_atomic(manifest_path, json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+    LOG.info(
+        "> Downloaded %d/%d license files", sum(1 for entry in entries if entry["status"] != "failed"), len(serials)
+    )
+    return entries
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+"""_license_store.py: Content-addressed store of downloaded license files."""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+from typing import BinaryIO, Iterable, Iterator, Union
+from urllib.parse import quote, unquote
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+__author__ = "Charles Prevot"
+__copyright__ = "Copyright 2024"
+
+LOG = logging.getLogger("forticare")
+
+
+def _license_file_name(serial_number: str) -> str:
+    # serial numbers are alphanumeric, anything else must not escape the destination directory
+    return re.sub(r"[^A-Za-z0-9_-]", "_", serial_number) + ".lic"
+
+
+class LicenseStore(object):
+    """
+    Keep downloaded license files on disk so `download_licenses` does not fetch them again.
+
+    Files are stored once per content under `objects/<sha256>`, and `index/<serial>.json` records
+    the hash of the file of each serial number and the time it was fetched. A put only writes its
+    own record, and a lock file keeps processes sharing the store directory consistent.
+    """
+
+    def __init__(self, root: str, max_age: float = None):
+        """
+        :param root: Store directory, created if missing
+        :type root: str
+        :param max_age: Time after which a stored file is downloaded again, in seconds. None keeps files forever.
+        :type max_age: float
+        """
+        self._root = root
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(root, "index"), exist_ok=True)
+        self._migrate_index()
+
+    @property
+    def root(self) -> str:
+        """Get store directory"""
+        return self._root
+
+    def _object_path(self, sha256: str) -> str:
+        return os.path.join(self._root, "objects", sha256)
+
+    def _record_path(self, serial_number: str) -> str:
+        # quoting keeps any serial number inside the index directory
+        return os.path.join(self._root, "index", quote(str(serial_number), safe="") + ".json")
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self._root, ".lock"), "a", encoding="utf-8") as _f:
+                fcntl.flock(_f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(_f, fcntl.LOCK_UN)
+
+    def _migrate_index(self) -> None:
+        """Split the single `index.json` of older stores into per-serial records"""
+        path = os.path.join(self._root, "index.json")
+        if not os.path.exists(path):
+            return
+        with self._locked():
+            try:
+                with open(path, "r", encoding="utf-8") as _f:
+                    index = json.load(_f)
+            except FileNotFoundError:
+                return
+            except ValueError:
+                LOG.warning(">>> Ignoring corrupted license store index %s", path)
+                index = {}
+            for serial_number, entry in index.items():
+                if not os.path.exists(self._record_path(serial_number)):
+                    self._write_record(serial_number, entry)
+            os.unlink(path)
+
+    def _read_record(self, serial_number: str) -> dict:
+        try:
+            with open(self._record_path(serial_number), "r", encoding="utf-8") as _f:
+                return json.load(_f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            LOG.warning(">>> Ignoring corrupted license store record %s", self._record_path(serial_number))
+            return None
+
+    def _write_record(self, serial_number: str, entry: dict) -> None:
+        self._write(self._record_path(serial_number), json.dumps(entry, sort_keys=True).encode("utf-8"))
+
+    def _records(self) -> Iterator[dict]:
+        for name in os.listdir(os.path.join(self._root, "index")):
+            if name.endswith(".json"):
+                entry = self._read_record(unquote(name[: -len(".json")]))
+                if entry is not None:
+                    yield entry
+
+    def _write(self, path: str, data: bytes) -> None:
+        _fd, _tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp")
+        try:
+            with os.fdopen(_fd, "wb") as _f:
+                _f.write(data)
+            os.replace(_tmp, path)
+        except Exception:
+            os.unlink(_tmp)
+            raise
+
+    def _fresh(self, entry: dict) -> bool:
+        return self.max_age is None or entry["fetched_at"] + self.max_age > time.time()
+
+    def get(self, serial_number: str) -> str:
+        """
+        Get the stored license file of a serial number.
+        :param serial_number: Serial number
+        :type serial_number: str
+        :return str: Return the license file, or None if it is missing or older than `max_age`
+        """
+        entry = self._read_record(serial_number)
+        if entry is None or not self._fresh(entry):
+            return None
+        try:
+            with open(self._object_path(entry["sha256"]), "r", encoding="utf-8") as _f:
+                return _f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, serial_number: str, license_file: str) -> str:
+        """
+        Store the license file of a serial number. Identical files are stored once.
+        :param serial_number: Serial number
+        :type serial_number: str
+        :param license_file: License file content
+        :type license_file: str
+        :return str: Return the SHA-256 of the file
+        """
+        data = license_file.encode("utf-8")
+        sha256 = hashlib.sha256(data).hexdigest()
+        # the lock keeps a concurrent delete from removing the object before the record points to it
+        with self._locked():
+            if not os.path.exists(self._object_path(sha256)):
+                self._write(self._object_path(sha256), data)
+            self._write_record(serial_number, {"sha256": sha256, "fetched_at": time.time()})
+        return sha256
+
+    def delete(self, serial_number: str) -> None:
+        """Forget the license file of a serial number, its content is removed once no serial number uses it"""
+        with self._locked():
+            entry = self._read_record(serial_number)
+            if entry is None:
+                return
+            os.unlink(self._record_path(serial_number))
+            if all(other["sha256"] != entry["sha256"] for other in self._records()):
+                try:
+                    os.unlink(self._object_path(entry["sha256"]))
+                except FileNotFoundError:
+                    pass
+
+    def export(self, serials: Iterable[str], dest: Union[str, BinaryIO], format: str = "zip") -> list[str]:
+        """
+        Write a bundle of stored license files, one `<serial>.lic` member each, named like the files
+        written by `download_licenses_bulk`.
+        Files are copied in chunks, the bundle is never built in memory.
+        :param serials: Serial numbers
+        :type serials: Iterable[str]
+        :param dest: Bundle path or binary file object
+        :type dest: str or BinaryIO
+        :param format: zip or tar
+        :type format: str
+        :return list: Return the serial numbers exported, those missing from the store are skipped
+        """
+        if format not in ("zip", "tar"):
+            raise ValueError(f"Unsupported bundle format: {format}")
+        entries = [(str(sn), self._read_record(sn)) for sn in dict.fromkeys(serials)]
+        exported = []
+        _f = open(dest, "wb") if isinstance(dest, str) else dest
+        try:
+            if format == "zip":
+                with zipfile.ZipFile(_f, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+                    for serial_number, entry in entries:
+                        if entry is None:
+                            continue
+                        with (
+                            open(self._object_path(entry["sha256"]), "rb") as src,
+                            bundle.open(_license_file_name(serial_number), "w") as dst,
+                        ):
+                            shutil.copyfileobj(src, dst)
+                        exported.append(serial_number)
+            else:
+                # "w|" writes a stream: dest does not need to be seekable
+                with tarfile.open(fileobj=_f, mode="w|") as bundle:
+                    for serial_number, entry in entries:
+                        if entry is None:
+                            continue
+                        path = self._object_path(entry["sha256"])
+                        info = tarfile.TarInfo(_license_file_name(serial_number))
+                        info.size = os.path.getsize(path)
+                        info.mtime = int(entry["fetched_at"])
+                        with open(path, "rb") as src:
+                            bundle.addfile(info, src)
+                        exported.append(serial_number)
+        finally:
+            if isinstance(dest, str):
+                _f.close()
+        missing = len(entries) - len(exported)
+        if missing:
+            LOG.warning(">>> %d license files missing from the store were not exported", missing)
+        return exported
+
+    def __contains__(self, serial_number: str) -> bool:
+        return os.path.exists(self._record_path(serial_number))
+
+    def __len__(self) -> int:
+        return sum(1 for name in os.listdir(os.path.join(self._root, "index")) if name.endswith(".json"))
+
+    def __str__(self) -> str:
+        return f"LicenseStore({self._root})"
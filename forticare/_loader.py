@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+"""_loader.py: Stream registration units from CSV or NDJSON files."""
+
+import csv
+import itertools
+import json
+import logging
+import os
+from typing import Iterator, TextIO, Tuple, Union
+
+from .location import Location
+from .registration_unit import LicenseRegistrationUnit, ProductRegistrationUnit, ServiceRegistrationUnit
+
+__author__ = "Charles Prevot"
+__copyright__ = "Copyright 2024"
+
+LOG = logging.getLogger("forticare")
+
+UNIT_TYPES = {
+    "product": ProductRegistrationUnit,
+    "license": LicenseRegistrationUnit,
+    "service": ServiceRegistrationUnit,
+}
+UNIT_FIELDS = {
+    "product": (
+        "serialNumber",
+        "contractNumber",
+        "description",
+        "isGovernment",
+        "additionalInfo",
+        "folderId",
+        "assetGroupIds",
+        "replacedSerialNumber",
+        "cloudKey",
+    ),
+    "license": (
+        "licenseRegistrationCode",
+        "serialNumber",
+        "description",
+        "isGovernment",
+        "additionalInfo",
+        "folderId",
+        "assetGroupIds",
+        "replacedSerialNumber",
+        "cloudKey",
+    ),
+    "service": ("contractNumber", "description", "isGovernment", "additionalInfo"),
+}
+LOCATION_FIELDS = (
+    "address",
+    "postalCode",
+    "countryCode",
+    "city",
+    "stateOrProvince",
+    "company",
+    "email",
+    "phone",
+    "fax",
+)
+_TRUE = frozenset(["true", "yes", "y", "1"])
+_FALSE = frozenset(["false", "no", "n", "0", ""])
+
+
+def _parse_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in _TRUE:
+        return True
+    if value in _FALSE:
+        return False
+    raise ValueError(f"Invalid boolean: {value}")
+
+
+def _guess_format(source) -> str:
+    name = source if isinstance(source, str) else getattr(source, "name", "")
+    extension = os.path.splitext(str(name))[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".ndjson", ".jsonl"):
+        return "ndjson"
+    raise ValueError(f"Can't guess the format of {name or source}, set format='csv' or format='ndjson'")
+
+
+def _iter_rows(_f: TextIO, format: str) -> Iterator[Tuple[int, Union[dict, str]]]:
+    """Yield (line number, row) tuples, NDJSON rows are left unparsed"""
+    if format == "csv":
+        reader = csv.DictReader(_f)
+        for row in reader:
+            yield reader.line_num, row
+    elif format == "ndjson":
+        for line_num, line in enumerate(_f, 1):
+            if line.strip() != "":
+                yield line_num, line
+    else:
+        raise ValueError(f"Unsupported format: {format}")
+
+
+def _build_unit(
+    row: Union[dict, str], kind: str
+) -> Tuple[Union[ProductRegistrationUnit, LicenseRegistrationUnit, ServiceRegistrationUnit], Location]:
+    """Build the registration unit and location described by a row"""
+    if isinstance(row, str):
+        row = json.loads(row)
+        if not isinstance(row, dict):
+            raise ValueError("Expected a JSON object")
+    kwargs = {}
+    for field in UNIT_FIELDS[kind]:
+        value = row.get(field)
+        if value is None:
+            continue
+        kwargs[field] = _parse_bool(value) if field == "isGovernment" else str(value).strip()
+    if kind == "license" and not kwargs.get("licenseRegistrationCode"):
+        raise ValueError("License registration code can't be empty")
+    if kind == "service":
+        kwargs.setdefault("contractNumber", "")
+    if kind == "product":
+        kwargs.setdefault("serialNumber", "")
+    unit = UNIT_TYPES[kind](**kwargs)
+
+    location = None
+    location_kwargs = {field: str(row[field]).strip() for field in LOCATION_FIELDS if row.get(field)}
+    if location_kwargs:
+        location = Location(**location_kwargs)
+    return unit, location
+
+
+def load_units(
+    source: Union[str, TextIO], kind: str = "product", format: str = None, skip_invalid: bool = False
+) -> Iterator[Tuple[Union[ProductRegistrationUnit, LicenseRegistrationUnit, ServiceRegistrationUnit], Location]]:
+    """
+    Read registration units from a CSV or NDJSON file, one row at a time.
+    Columns are named after the registration unit attributes (serialNumber, contractNumber,
+    licenseRegistrationCode, cloudKey...) and the Location attributes (address, postalCode, countryCode...).
+    Unknown columns are ignored.
+    :param source: File path or text file object
+    :type source: str or TextIO
+    :param kind: Unit type: product, license or service
+    :type kind: str
+    :param format: csv or ndjson. Default is guessed from the file extension.
+    :type format: str
+    :param skip_invalid: Log and skip invalid rows instead of raising ValueError
+    :type skip_invalid: bool
+    :return Iterator: Yield (unit, location or None) tuples
+    """
+    if kind not in UNIT_TYPES:
+        raise ValueError(f"Unsupported unit type: {kind}")
+    if format is None:
+        format = _guess_format(source)
+    _f = open(source, "r", encoding="utf-8", newline="") if isinstance(source, str) else source
+    try:
+        for line_num, row in _iter_rows(_f, format):
+            try:
+                yield _build_unit(row, kind)
+            except (TypeError, ValueError) as exp:
+                if not skip_invalid:
+                    raise ValueError(f"line {line_num}: {exp}") from exp
+                LOG.warning(">>> Skipping invalid row at line %d: %s", line_num, exp)
+    finally:
+        if isinstance(source, str):
+            _f.close()
+
+
+def register_from_file(
+    self,
+    source: Union[str, TextIO],
+    kind: str = "product",
+    format: str = None,
+    skip_invalid: bool = False,
+    batch_size: int = 1000,
+    max_workers: int = 4,
+    journal=None,
+) -> Iterator[Tuple]:
+    """
+    Register the units of a CSV or NDJSON file through the bulk registration APIs.
+    Rows are read and registered `batch_size` at a time, so memory does not grow with the file size.
+    Registration happens while the returned iterator is consumed.
+    :param source: File path or text file object, see `load_units`
+    :type source: str or TextIO
+    :param kind: Unit type: product, license or service
+    :type kind: str
+    :param format: csv or ndjson. Default is guessed from the file extension.
+    :type format: str
+    :param skip_invalid: Log and skip invalid rows instead of raising ValueError
+    :type skip_invalid: bool
+    :param batch_size: Number of rows handed to the bulk API at once
+    :type batch_size: int
+    :param max_workers: Maximum number of concurrent requests
+    :type max_workers: int
+    :param journal: Journal recording the outcome of each unit
+    :type journal: RegistrationJournal
+    :return Iterator: Yield (serial number, RegistrationResult) tuples for products,
+        (unit, registered asset or exception) tuples for licenses and services
+    """
+    rows = load_units(source, kind, format, skip_invalid)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return
+        units = [unit for unit, _ in batch]
+        if kind == "product":
+            locations = [(unit.serialNumber, location) for unit, location in batch if location is not None]
+            yield from self.register_products_bulk(units, locations, max_workers=max_workers, journal=journal).items()
+        elif kind == "license":
+            yield from self.register_licenses_bulk(units, max_workers=max_workers, journal=journal)
+        else:
+            yield from self.register_services_bulk(units, max_workers=max_workers, journal=journal)
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+"""_metrics.py: Counters describing the client activity."""
+
+import threading
+from collections import Counter
+
+__author__ = "Charles Prevot"
+__copyright__ = "Copyright 2024"
+
+
+class Metrics(object):
+    """Thread-safe named counters"""
+
+    def __init__(self):
+        self._counters = Counter()
+        self._lock = threading.Lock()
+
+    def incr(self, name: str, value: int = 1) -> None:
+        """Increment a counter"""
+        with self._lock:
+            self._counters[name] += value
+
+    def get(self, name: str) -> int:
+        """Get a counter value"""
+        with self._lock:
+            return self._counters[name]
+
+    def snapshot(self) -> dict:
+        """Get a copy of every counter"""
+        with self._lock:
+            return dict(self._counters)
+
+    def reset(self) -> None:
+        """Reset every counter"""
+        with self._lock:
+            self._counters.clear()
+
+    def __str__(self) -> str:
+        return f"Metrics({self.snapshot()})"
@@ -3,14 +3,23 @@
 """_product.py: ."""
 
 from ._helpers import *
+from ._helpers import _parse_asset_details, _map_concurrent, _is_rejection
 import logging
-import json
+import re
+import requests
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
-from typing import List, Tuple
+from typing import Iterable, Iterator, List, Tuple, Union
 
-from .registration_unit import LicenseRegistrationUnit, ProductRegistrationUnit, ServiceRegistrationUnit
+from .registration_unit import (
+    LicenseRegistrationUnit,
+    ProductRegistrationUnit,
+    RegistrationResult,
+    ServiceRegistrationUnit,
+)
 from .asset import Asset, Service
 from .location import Location
+from ._journal import REGISTERED, SUBMITTED, RegistrationJournal, unit_key
 
 __author__ = "Charles Prevot"
 __copyright__ = "Copyright 2024"
@@ -18,8 +27,37 @@ __copyright__ = "Copyright 2024"
 LOG = logging.getLogger("forticare")
 
 
+def _products_body(expire_before: datetime, serial_number: str, product_model: str, status: str) -> dict:
+    """Build a `/products/list` request body"""
+    body = {
+        "status": str(status),
+        "expireBefore": expire_before.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    if serial_number != "":
+        body["serialNumber"] = str(serial_number)
+    if product_model != "":
+        body["productModel"] = str(product_model)
+    return body
+
+
+def _parse_products(results: dict, lazy: bool = False, raw: bool = False) -> list[Asset]:
+    """Build assets from a `/products/list` or `/products/register` response, or return their JSON objects if `raw`"""
+    if isinstance(results, dict) and "assets" in results:
+        if raw:
+            return results["assets"] or []
+        return [Asset(asset, lazy) for asset in results["assets"] or []]
+    else:
+        raise Exception("Inexpected response from API:/n%s", results)
+
+
 def get_products(
-    self, expire_before: datetime, serial_number: str = "", product_model: str = "", status: str = "Registered"
+    self,
+    expire_before: datetime,
+    serial_number: str = "",
+    product_model: str = "",
+    status: str = "Registered",
+    lazy: bool = False,
+    raw: bool = False,
 ) -> list[Asset]:
     """
     Returns product list based on product SN search pattern or support package expiration date.
@@ -32,17 +70,14 @@ def get_products(
     :type product_model: str
     :param status: Allowed values are Registered and Pending. Default value is Registered.
     :type status: str
+    :param lazy: Build the dates and child objects of each asset on first access only
+    :type lazy: bool
+    :param raw: Return the JSON objects of the API response instead of Asset objects
+    :type raw: bool
     :return list: Return a list of assets
     """
     endpoint = "/products/list"
-    body = {
-        "status": str(status),
-        "expireBefore": expire_before.strftime("%Y-%m-%dT%H:%M:%S"),
-    }
-    if serial_number != "":
-        body["serialNumber"] = str(serial_number)
-    if product_model != "":
-        body["productModel"] = str(product_model)
+    body = _products_body(expire_before, serial_number, product_model, status)
 
     LOG.info("> Retriving assets list...")
     results = {}
@@ -52,17 +87,175 @@ def get_products(
         LOG.error(">>> Failed to retrive assets: %s", str(exp.args))
         raise exp
 
-    if isinstance(results, dict) and "assets" in results:
-        return [Asset(asset) for asset in results["assets"]]
-    else:
+    return _parse_products(results, lazy, raw)
+
+
+def _fetch_products_page(self, body: dict, page_number: int) -> dict:
+    """Fetch one page of a `/products/list` query"""
+    results = self._post("/products/list", dict(body, pageNumber=page_number))
+    if not isinstance(results, dict) or "assets" not in results:
         raise Exception("Inexpected response from API:/n%s", results)
+    return results
+
+
+def _iter_products_pages(self, body: dict, prefetch: bool = False) -> Iterator[dict]:
+    """
+    Walk every page of a `/products/list` query.
+    :param body: Request body, without page number
+    :type body: dict
+    :param prefetch: Fetch page N+1 in the background while page N is processed
+    :type prefetch: bool
+    :return Iterator: Yield raw responses, one per page
+    """
+    executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    try:
+        page_number = 1
+        results = _fetch_products_page(self, body, page_number)
+        while True:
+            total_pages = results.get("totalPages") or 1
+            next_page = None
+            if executor is not None and page_number < total_pages:
+                next_page = executor.submit(_fetch_products_page, self, body, page_number + 1)
+            yield results
+            if page_number >= total_pages:
+                return
+            page_number += 1
+            if next_page is not None:
+                results = next_page.result()
+            else:
+                results = _fetch_products_page(self, body, page_number)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
 
+def iter_products(
+    self,
+    expire_before: datetime,
+    serial_number: str = "",
+    product_model: str = "",
+    status: str = "Registered",
+    prefetch: bool = False,
+    lazy: bool = False,
+    raw: bool = False,
+) -> Iterator[Asset]:
+    """
+    Iterate over every page of the product list, one asset at a time.
+    Same filters as `get_products`. Only one page is held in memory at once (two with prefetch).
+    :param expire_before: Date time in ISO 8601 format
+    :type expire_before: datetime
+    :param serial_number: Serial number or serial number search pattern
+    :type serial_number: str
+    :param product_model: Product model name
+    :type product_model: str
+    :param status: Allowed values are Registered and Pending. Default value is Registered.
+    :type status: str
+    :param prefetch: Fetch the next page in the background while the current one is consumed
+    :type prefetch: bool
+    :param lazy: Build the dates and child objects of each asset on first access only
+    :type lazy: bool
+    :param raw: Yield the JSON objects of the API response instead of Asset objects
+    :type raw: bool
+    :return Iterator: Yield assets
+    """
+    body = _products_body(expire_before, serial_number, product_model, status)
 
-def get_product_details(self, serial_number: str) -> Asset:
+    LOG.info("> Retriving assets list...")
+    try:
+        for results in _iter_products_pages(self, body, prefetch):
+            for asset in results["assets"] or []:
+                yield asset if raw else Asset(asset, lazy)
+    except Exception as exp:
+        LOG.error(">>> Failed to retrive assets: %s", str(exp.args))
+        raise exp
+
+
+def _sweep_partition(self, body: dict, max_pages: int, can_split: bool) -> list[dict]:
+    """
+    Fetch every asset of a sweep partition.
+    :return list: Return raw assets, or None if the partition has more than `max_pages` pages and must be split
+    """
+    results = _fetch_products_page(self, body, 1)
+    total_pages = results.get("totalPages") or 1
+    if total_pages > max_pages and can_split:
+        return None
+    assets = list(results["assets"] or [])
+    for page_number in range(2, total_pages + 1):
+        assets.extend(_fetch_products_page(self, body, page_number)["assets"] or [])
+    return assets
+
+
+def sweep_inventory(
+    self,
+    expire_before: datetime,
+    prefixes: Iterable[str] = SERIAL_ALPHABET,
+    product_model: str = "",
+    status: str = "Registered",
+    max_workers: int = 8,
+    max_pages: int = 2,
+    wildcard: str = SERIAL_WILDCARD,
+) -> list[Asset]:
+    """
+    List the whole inventory by splitting the search into serial number prefix partitions queried concurrently.
+    A partition spanning more than `max_pages` pages is split again into one partition per next serial character.
+    Assets are merged and deduplicated by serial number.
+    :param expire_before: Date time in ISO 8601 format
+    :type expire_before: datetime
+    :param prefixes: Serial number prefixes to start from. Default is one partition per alphanumeric character.
+    :type prefixes: Iterable[str]
+    :param product_model: Product model name
+    :type product_model: str
+    :param status: Allowed values are Registered and Pending. Default value is Registered.
+    :type status: str
+    :param max_workers: Maximum number of partitions queried at once
+    :type max_workers: int
+    :param max_pages: Maximum number of pages walked sequentially in one partition before splitting it
+    :type max_pages: int
+    :param wildcard: Wildcard appended to a prefix to build the serial number search pattern
+    :type wildcard: str
+    :return list: Return a list of assets, sorted by serial number
+    """
+    assets = {}
+    LOG.info("> Sweeping inventory...")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        def _submit(prefix: str):
+            body = _products_body(expire_before, prefix + wildcard, product_model, status)
+            future = executor.submit(_sweep_partition, self, body, max_pages, len(prefix) < SERIAL_LENGTH - 1)
+            pending[future] = prefix
+
+        pending = {}
+        for prefix in dict.fromkeys(prefixes):
+            _submit(prefix)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                prefix = pending.pop(future)
+                try:
+                    partition = future.result()
+                except Exception as exp:
+                    LOG.error(">>> Failed to sweep partition %s: %s", prefix, str(exp.args))
+                    for _future in pending:
+                        _future.cancel()
+                    raise exp
+                if partition is None:
+                    LOG.debug("Splitting sweep partition %s", prefix)
+                    for char in SERIAL_ALPHABET:
+                        _submit(prefix + char)
+                    continue
+                for asset in partition:
+                    assets[asset["serialNumber"]] = asset
+
+    return [Asset(assets[serial]) for serial in sorted(assets)]
+
+
+def get_product_details(self, serial_number: str, raw: bool = False) -> Asset:
     """
     Returns product details based on product SN.
     :param serial_number: Serial number or serial number search pattern
     :type serial_number: str
+    :param raw: Return the JSON object of the API response instead of an Asset object
+    :type raw: bool
     :return Asset: Return asset details
     """
     endpoint = "/products/details"
@@ -76,7 +269,67 @@ def get_product_details(self, serial_number: str) -> Asset:
         LOG.error(">>> Failed to retrive asset details: %s", str(exp.args))
         raise exp
 
-    return Asset(results["assetDetails"])
+    return _parse_asset_details(results, raw)
+
+
+def get_products_details(
+    self, serials: Iterable[str], max_workers: int = 8, ordered: bool = True
+) -> Iterator[Tuple[str, Union[Asset, Exception]]]:
+    """
+    Returns product details for many serial numbers, fetched concurrently.
+    Duplicate serial numbers are fetched once. A failed lookup is yielded with its exception
+    and does not abort the batch.
+    :param serials: Serial numbers
+    :type serials: Iterable[str]
+    :param max_workers: Maximum number of concurrent requests
+    :type max_workers: int
+    :param ordered: Yield results in input order, otherwise as soon as they complete
+    :type ordered: bool
+    :return Iterator: Yield (serial_number, Asset or exception) tuples
+    """
+    serials = list(dict.fromkeys(str(serial) for serial in serials))
+    LOG.info("> Retriving %d asset details...", len(serials))
+    yield from _map_concurrent(self.get_product_details, serials, max_workers, ordered)
+
+
+def _register_product_body(units: list[ProductRegistrationUnit], locations: list[Tuple[str, Location]]) -> dict:
+    """
+    Build a `/products/register` request body.
+    Identical locations are sent once and referenced by every unit using them.
+    """
+    location_by_serial = {serial: location for serial, location in locations}
+    # keyed on the whole payload: Location equality only compares the address, not the company or contact
+    location_index = {}  # distinct location payload -> index in body["locations"]
+    _locations_list = []
+    _units_list = []
+    for unit in units:
+        _unit = ProductRegistrationUnit.to_json(unit)
+        location = location_by_serial.get(_unit["serialNumber"])
+        if location is not None:
+            _location = location.to_json()
+            index = location_index.setdefault(tuple(sorted(_location.items())), len(_locations_list))
+            if index == len(_locations_list):
+                _locations_list.append(_location)
+            _unit["location"] = {"ref": "#/locations/" + str(index)}
+        _units_list.append(_unit)
+    body = {
+        "registrationUnits": _units_list,
+    }
+    if len(_locations_list) > 0:
+        body["locations"] = _locations_list
+    return body
+
+
+def _parse_register_product(units: list[ProductRegistrationUnit], results: dict) -> bool:
+    """Check a `/products/register` response"""
+    asset_list = _parse_products(results)
+    for asset in asset_list:
+        if asset.status == "Registered":
+            for unit in units:
+                if asset.serialNumber == unit.serialNumber:
+                    break
+                return False
+    return True
 
 
 # {
@@ -191,18 +444,9 @@ def register_product(self, units: list[ProductRegistrationUnit], locations: list
     :return list[Asset]: Return a list of register assets
     """
     endpoint = "/products/register"
-    _units_list = [ProductRegistrationUnit.to_json(unit) for unit in units]
-    for unit in _units_list:
-        for index, location in enumerate(locations):
-            if unit["serialNumber"] == location[0]:
-                unit["location"] = {"ref": "#/locations/" + str(index)}
-    body = {
-        "registrationUnits": _units_list,
-    }
-    if len(locations) > 0:
-        body["locations"] = [location[1].to_json() for location in locations]
+    body = _register_product_body(units, locations)
 
-    print(json.dumps(body, indent=4))
+    LOG.debug("%s", body)
     LOG.info("> Registering new product...")
     results = {}
     try:
@@ -211,15 +455,157 @@ def register_product(self, units: list[ProductRegistrationUnit], locations: list
         LOG.error(">>> Failed to register product: %s", str(exp.args))
         raise exp
 
-    asset_list = []
-    if isinstance(results, dict) and "assets" in results:
-        asset_list = [Asset(asset) for asset in results["assets"]]
-    else:
-        raise Exception("Inexpected response from API:/n%s", results)
-    for asset in asset_list:
-        if asset.status == "Registered":
-            for unit in units:
-                if asset.serialNumber == unit.serialNumber:
-                    break
-                return False
-    return True
+    return _parse_register_product(units, results)
+
+
+def _registered_asset(asset: dict) -> Asset:
+    """Build an asset from a registration response, None if its details are incomplete"""
+    try:
+        return Asset(asset)
+    except ValueError:
+        return None
+
+
+def _register_product_chunk(
+    self,
+    units: list[ProductRegistrationUnit],
+    locations: list[Tuple[str, Location]],
+    journal: RegistrationJournal = None,
+) -> dict[str, RegistrationResult]:
+    """
+    Register one chunk of products and report the outcome of each unit. Never raises.
+    :return dict: Return registration results by serial number
+    """
+    body = _register_product_body(units, locations)
+    if journal is not None:
+        journal.mark_submitted([unit_key(unit) for unit in units])
+    assets = None
+    message = ""
+    # whether the units missing from the response may have been registered anyway
+    unknown = False
+    try:
+        results = self._post("/products/register", body)
+        assets = results.get("assets") if isinstance(results, dict) else None
+        if assets is None:
+            message = f"Inexpected response from API: {results}"
+            unknown = True
+    except requests.exceptions.HTTPError as exp:
+        message = str(exp.args[-1])
+        unknown = not _is_rejection(exp)
+        j_data = {}
+        if exp.response is not None:
+            try:
+                j_data = exp.response.json()
+            except ValueError:
+                pass
+        assets = j_data.get("assets") if isinstance(j_data, dict) else None
+    except Exception as exp:
+        # transport error: the request may have reached the API
+        message = str(exp.args[-1]) if exp.args else repr(exp)
+        unknown = True
+
+    outcome = {}
+    for asset in assets or []:
+        registered = asset.get("status") == "Registered"
+        outcome[asset["serialNumber"]] = RegistrationResult(
+            asset["serialNumber"],
+            registered,
+            asset.get("message") or "",
+            _registered_asset(asset) if registered else None,
+        )
+    # units missing from the response: the whole chunk was rejected, possibly because of a single unit
+    bad_unit = re.search(r"units\[(\d+)\]", message)
+    unsettled = set()
+    for index, unit in enumerate(units):
+        if unit.serialNumber in outcome:
+            continue
+        if unknown:
+            unsettled.add(unit.serialNumber)
+            unit_message = f"Outcome unknown, check before submitting again: {message}"
+        elif message == "":
+            unit_message = "Missing from API response"
+        elif bad_unit is not None and int(bad_unit.group(1)) == index:
+            unit_message = message
+        else:
+            unit_message = f"Not registered, batch rejected: {message}"
+        outcome[unit.serialNumber] = RegistrationResult(unit.serialNumber, False, unit_message)
+    if journal is not None:
+        # units of unknown outcome stay submitted, the next run looks them up
+        for unit in units:
+            if unit.serialNumber in unsettled:
+                continue
+            result = outcome[unit.serialNumber]
+            journal.mark_result(unit_key(unit), result.registered, result.message, unit.serialNumber)
+    return outcome
+
+
+def _journaled_products(
+    self, units: list[ProductRegistrationUnit], journal: RegistrationJournal, max_workers: int
+) -> Tuple[list[ProductRegistrationUnit], dict[str, RegistrationResult]]:
+    """
+    Record units in the journal and sort out those already registered by a previous run.
+    Units submitted without a known outcome (e.g. the process died waiting for the response)
+    are looked up to find out whether the registration went through.
+    :return tuple: Return (units to submit, results of the units already registered)
+    """
+    journal.record(units)
+    states = journal.states(unit_key(unit) for unit in units)
+    done = {}
+    for unit in units:
+        if states.get(unit_key(unit)) == REGISTERED:
+            done[unit.serialNumber] = RegistrationResult(unit.serialNumber, True, "Already registered (journal)")
+    unknown = {unit.serialNumber: unit for unit in units if states.get(unit_key(unit)) == SUBMITTED}
+    if unknown:
+        LOG.info("> Reconciling %d products with unknown registration outcome...", len(unknown))
+        for serial, asset in self.get_products_details(unknown, max_workers=max_workers):
+            if isinstance(asset, Asset) and asset.status == "Registered":
+                journal.mark_result(unit_key(unknown[serial]), True, "Registered (reconciled)", serial)
+                done[serial] = RegistrationResult(serial, True, "Already registered (reconciled)", asset)
+    return [unit for unit in units if unit.serialNumber not in done], done
+
+
+def register_products_bulk(
+    self,
+    units: Iterable[ProductRegistrationUnit],
+    locations: list[Tuple[str, Location]] = [],
+    chunk_size: int = 50,
+    max_workers: int = 4,
+    journal: RegistrationJournal = None,
+) -> dict[str, RegistrationResult]:
+    """
+    Register many products, split in chunks submitted concurrently.
+    Each chunk only carries the locations of its own units. A rejected chunk does not abort the others,
+    so only failed units need to be submitted again.
+    With a journal, the run can be resumed: units registered by a previous run are not submitted again.
+    :param units: Registration units
+    :type units: Iterable[ProductRegistrationUnit]
+    :param locations: Locations
+    :type locations: list[Tuple[serial_number: <string>, location: <Location>]]
+    :param chunk_size: Maximum number of units per request
+    :type chunk_size: int
+    :param max_workers: Maximum number of chunks submitted at once
+    :type max_workers: int
+    :param journal: Journal recording the outcome of each unit
+    :type journal: RegistrationJournal
+    :return dict: Return registration results by serial number, in input order
+    """
+    units = list(units)
+    outcome = {}
+    pending = units
+    if journal is not None:
+        pending, outcome = _journaled_products(self, units, journal, max_workers)
+    locations_by_serial = {}
+    for location in locations:
+        locations_by_serial.setdefault(location[0], []).append(location)
+    chunks = []
+    for index in range(0, len(pending), chunk_size):
+        chunk = pending[index : index + chunk_size]
+        chunk_locations = [location for unit in chunk for location in locations_by_serial.get(unit.serialNumber, [])]
+        chunks.append((chunk, chunk_locations, journal))
+
+    LOG.info("> Registering %d products in %d chunks...", len(pending), len(chunks))
+    for _, chunk_outcome in _map_concurrent(lambda chunk: _register_product_chunk(self, *chunk), chunks, max_workers):
+        outcome.update(chunk_outcome)
+    results = {unit.serialNumber: outcome[unit.serialNumber] for unit in units}
+    LOG.info("> Registered %d/%d products", sum(1 for result in results.values() if result.registered), len(units))
+    return results
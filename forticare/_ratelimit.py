@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+"""_ratelimit.py: Client-side adaptive rate limiter."""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+__author__ = "Charles Prevot"
+__copyright__ = "Copyright 2024"
+
+
+class MemoryRateLimitBackend(object):
+    """Keep bucket states in memory, shared by every thread of the process"""
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def transaction(self, key: str):
+        """Lock and yield the (mutable) state of a bucket"""
+        with self._lock:
+            yield self._states.setdefault(key, {})
+
+
+class FileRateLimitBackend(object):
+    """Keep bucket states in a JSON file locked with flock, shared by every process using the same path"""
+
+    def __init__(self, path: str):
+        if fcntl is None:
+            raise NotImplementedError("FileRateLimitBackend requires fcntl (POSIX only)")
+        self._path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    @contextmanager
+    def transaction(self, key: str):
+        """Lock the state file and yield the (mutable) state of a bucket"""
+        with open(self._path, "a+", encoding="utf-8") as _f:
+            fcntl.flock(_f, fcntl.LOCK_EX)
+            try:
+                _f.seek(0)
+                try:
+                    states = json.loads(_f.read() or "{}")
+                except ValueError:
+                    states = {}
+                state = states.setdefault(key, {})
+                yield state
+                _f.seek(0)
+                _f.truncate()
+                _f.write(json.dumps(states))
+                _f.flush()
+            finally:
+                fcntl.flock(_f, fcntl.LOCK_UN)
+
+
+class RateLimiter(object):
+    """
+    Token bucket rate limiter with one bucket per endpoint.
+
+    The rate adapts AIMD-style: it is divided on every HTTP 429 and slowly increased back on success,
+    never above the configured rate. Use a `FileRateLimitBackend` to share the buckets between processes.
+    """
+
+    def __init__(
+        self,
+        rate: float = 5.0,
+        burst: int = None,
+        endpoint_rates: dict = None,
+        min_rate: float = 0.1,
+        increase: float = 0.1,
+        decrease: float = 0.5,
+        backend=None,
+    ):
+        """
+        :param rate: Default number of requests per second for each endpoint
+        :type rate: float
+        :param burst: Maximum number of requests sent back to back. Default is one second worth of requests.
+        :type burst: int
+        :param endpoint_rates: Requests per second for specific endpoints, e.g. {"/licenses/download": 1}
+        :type endpoint_rates: dict
+        :param min_rate: Rate never goes below this value
+        :type min_rate: float
+        :param increase: Requests per second added back after each successful request
+        :type increase: float
+        :param decrease: Factor applied to the rate on each HTTP 429
+        :type decrease: float
+        :param backend: Where bucket states are kept. Default is in memory.
+        :type backend: MemoryRateLimitBackend or FileRateLimitBackend
+        """
+        self.rate = rate
+        self.burst = burst
+        self.endpoint_rates = dict(endpoint_rates or {})
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self._backend = backend if backend is not None else MemoryRateLimitBackend()
+
+    def max_rate(self, endpoint: str) -> float:
+        """Get the configured rate of an endpoint"""
+        return self.endpoint_rates.get(endpoint, self.rate)
+
+    def _refill(self, endpoint: str, state: dict, now: float) -> None:
+        max_rate = self.max_rate(endpoint)
+        capacity = self.burst if self.burst is not None else max(1.0, max_rate)
+        if "rate" not in state:
+            state.update(rate=max_rate, tokens=capacity, updated=now)
+        state["rate"] = min(state["rate"], max_rate)
+        state["tokens"] = min(capacity, state["tokens"] + (now - state["updated"]) * state["rate"])
+        state["updated"] = now
+
+    def reserve(self, endpoint: str) -> float:
+        """
+        Take a token from the endpoint bucket.
+        :param endpoint: API endpoint
+        :type endpoint: str
+        :return float: Return how long the caller must wait before sending the request, in seconds
+        """
+        with self._backend.transaction(endpoint) as state:
+            self._refill(endpoint, state, time.time())
+            state["tokens"] -= 1
+            if state["tokens"] >= 0:
+                return 0.0
+            return -state["tokens"] / state["rate"]
+
+    def acquire(self, endpoint: str) -> float:
+        """
+        Block until a request can be sent to the endpoint.
+        :return float: Return the time spent waiting, in seconds
+        """
+        delay = self.reserve(endpoint)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def on_throttled(self, endpoint: str) -> None:
+        """Decrease the endpoint rate after an HTTP 429"""
+        with self._backend.transaction(endpoint) as state:
+            self._refill(endpoint, state, time.time())
+            state["rate"] = max(self.min_rate, state["rate"] * self.decrease)
+
+    def on_success(self, endpoint: str) -> None:
+        """Increase the endpoint rate back after a successful request"""
+        with self._backend.transaction(endpoint) as state:
+            self._refill(endpoint, state, time.time())
+            state["rate"] = min(self.max_rate(endpoint), state["rate"] + self.increase)
+
+    def current_rate(self, endpoint: str) -> float:
+        """Get the current (adapted) rate of an endpoint"""
+        with self._backend.transaction(endpoint) as state:
+            self._refill(endpoint, state, time.time())
+            return state["rate"]
+
+    def __str__(self) -> str:
+        return f"RateLimiter(rate={self.rate}, endpoint_rates={self.endpoint_rates})"
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+"""_retry.py: Retry policy for transient FortiCare errors."""
+
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Iterable
+
+from ._constants import NON_IDEMPOTENT_ENDPOINTS
+
+__author__ = "Charles Prevot"
+__copyright__ = "Copyright 2024"
+
+
+def _parse_retry_after(retry_after: str) -> float:
+    """
+    Parse a `Retry-After` header.
+    :param retry_after: Delay in seconds or HTTP date
+    :type retry_after: str
+    :return float: Return the delay in seconds, or None if the header is missing or invalid
+    """
+    if retry_after is None or retry_after == "":
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy(object):
+    """
+    Retry policy for transient errors: exponential backoff with full jitter, honoring `Retry-After`.
+
+    Registration endpoints are not idempotent: they are only retried when the server did not process the
+    request (connection never established, or HTTP 429).
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        backoff_factor: float = 0.5,
+        max_backoff: float = 30.0,
+        jitter: bool = True,
+        retry_statuses: Iterable[int] = (429, 502, 503, 504),
+        respect_retry_after: bool = True,
+        non_idempotent_endpoints: Iterable[str] = NON_IDEMPOTENT_ENDPOINTS,
+    ):
+        """
+        :param max_attempts: Maximum number of attempts per call, first one included. 1 disables retries.
+        :type max_attempts: int
+        :param backoff_factor: Delay before the first retry, doubled on every attempt
+        :type backoff_factor: float
+        :param max_backoff: Maximum delay between two attempts, `Retry-After` included
+        :type max_backoff: float
+        :param jitter: Pick a random delay between 0 and the computed backoff
+        :type jitter: bool
+        :param retry_statuses: HTTP status codes considered transient
+        :type retry_statuses: Iterable[int]
+        :param respect_retry_after: Wait for the delay given by the `Retry-After` header when present
+        :type respect_retry_after: bool
+        :param non_idempotent_endpoints: Endpoints that must not be replayed once the server received them
+        :type non_idempotent_endpoints: Iterable[str]
+        """
+        self.max_attempts = max_attempts
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses)
+        self.respect_retry_after = respect_retry_after
+        self.non_idempotent_endpoints = frozenset(non_idempotent_endpoints)
+
+    def is_idempotent(self, endpoint: str) -> bool:
+        """Check whether an endpoint can be safely replayed"""
+        return endpoint not in self.non_idempotent_endpoints
+
+    def should_retry(self, endpoint: str, attempt: int, status_code: int = None, sent: bool = True) -> bool:
+        """
+        Decide whether a failed attempt should be retried.
+        :param endpoint: API endpoint
+        :type endpoint: str
+        :param attempt: Number of attempts already made
+        :type attempt: int
+        :param status_code: HTTP status code, None for a network error
+        :type status_code: int
+        :param sent: For a network error, whether the request may have reached the server
+        :type sent: bool
+        :return bool: True if the call should be retried
+        """
+        if attempt >= self.max_attempts:
+            return False
+        if status_code is None:
+            return not sent or self.is_idempotent(endpoint)
+        if status_code not in self.retry_statuses:
+            return False
+        return status_code == 429 or self.is_idempotent(endpoint)
+
+    def backoff(self, attempt: int, retry_after: str = None) -> float:
+        """
+        Compute the delay before the next attempt.
+        :param attempt: Number of attempts already made
+        :type attempt: int
+        :param retry_after: `Retry-After` header of the failed response
+        :type retry_after: str
+        :return float: Return the delay in seconds
+        """
+        delay = _parse_retry_after(retry_after) if self.respect_retry_after else None
+        if delay is None:
+            delay = self.backoff_factor * (2 ** (attempt - 1))
+            if self.jitter:
+                delay = random.uniform(0, delay)
+        return min(delay, self.max_backoff)
+
+    def __str__(self) -> str:
+        return f"RetryPolicy(max_attempts={self.max_attempts}, backoff_factor={self.backoff_factor})"
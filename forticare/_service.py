@@ -3,12 +3,15 @@
 """_product.py: ."""
 
 from ._helpers import *
+from ._helpers import _parse_asset_details, _map_concurrent
 import uuid
 import logging
 from datetime import datetime
+from typing import Iterable, Tuple, Union
 
 from .asset import Asset, Service
 from .registration_unit import ServiceRegistrationUnit
+from ._journal import RegistrationJournal, _begin_single_use, _journal_failure
 
 __author__ = "Charles Prevot"
 __copyright__ = "Copyright 2024"
@@ -23,24 +26,61 @@ LOG = logging.getLogger("forticare")
 #   "additionalInfo": "",
 #   "isGovernment": false
 # }
-def register_services(self, service: ServiceRegistrationUnit) -> Asset:
+def register_services(self, service: ServiceRegistrationUnit, journal: RegistrationJournal = None) -> Asset:
     """
     Register a subscription contract (e.g. VM-S) to generate serial number.
     :param service: Service registration unit
     :type service: ServiceRegistrationUnit
+    :param journal: Journal recording the outcome. A contract already registered in the journal is not submitted again,
+        one submitted without a known outcome (e.g. a timeout) raises.
+    :type journal: RegistrationJournal
     :return Asset: An assets
     """
     endpoint = "/services/register"
     body = service.to_json()
 
+    key = None
+    if journal is not None:
+        key, serial_number = _begin_single_use(journal, service)
+        if serial_number:
+            LOG.info("> Service already registered (journal): %s", serial_number)
+            return self.get_product_details(serial_number)
+
     LOG.info("> Registering new service...")
     results = {}
     try:
         results: dict = self._post(endpoint, body)
     except Exception as exp:
         LOG.error(">>> Failed to register service: %s", str(exp.args))
+        if key is not None:
+            _journal_failure(journal, key, exp)
         raise exp
 
-    if isinstance(results, dict) and "assetDetails" in results:
-        return Asset(results["assetDetails"])
-    raise Exception("Inexpected response from API:/n%s", results)
+    asset = _parse_asset_details(results)
+    if key is not None:
+        journal.mark_result(key, True, "", asset.serialNumber)
+    return asset
+
+
+def register_services_bulk(
+    self, services: Iterable[ServiceRegistrationUnit], max_workers: int = 4, journal: RegistrationJournal = None
+) -> list[Tuple[ServiceRegistrationUnit, Union[Asset, Exception]]]:
+    """
+    Register many subscription contracts concurrently.
+    Duplicate units are registered once. A failed registration is returned with its exception
+    and does not abort the batch.
+    :param services: Service registration units
+    :type services: Iterable[ServiceRegistrationUnit]
+    :param max_workers: Maximum number of concurrent requests
+    :type max_workers: int
+    :param journal: Journal recording the outcome of each unit
+    :type journal: RegistrationJournal
+    :return list: Return (unit, registered asset or exception) tuples, in input order
+    """
+    services = list(services)
+    unique = list(dict.fromkeys(services))
+    LOG.info("> Registering %d services...", len(unique))
+    outcome = dict(
+        _map_concurrent(lambda service: self.register_services(service, journal=journal), unique, max_workers)
+    )
+    return [(service, outcome[service]) for service in services]
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+"""_session.py: HTTP connection pool shared by every FortiCare endpoint."""
+
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+
+from ._constants import FORTICARE_URL, FC_OAUTH
+from ._core import _cancel_refresh
+
+__author__ = "Charles Prevot"
+__copyright__ = "Copyright 2024"
+
+LOG = logging.getLogger("forticare")
+
+
+def _build_session(
+    pool_connections: int = 10, pool_maxsize: int = 10, pool_block: bool = False, keep_alive: bool = True
+) -> requests.Session:
+    """
+    Build a pooled HTTP session.
+    :param pool_connections: Number of per-host connection pools to cache
+    :type pool_connections: int
+    :param pool_maxsize: Maximum number of connections kept open per host
+    :type pool_maxsize: int
+    :param pool_block: Block when the per-host pool is exhausted instead of opening extra connections
+    :type pool_block: bool
+    :param keep_alive: Keep connections open between requests
+    :type keep_alive: bool
+    :return requests.Session: Return a configured session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if not keep_alive:
+        session.headers["Connection"] = "close"
+    return session
+
+
+def prewarm(self) -> None:
+    """
+    Open a connection to FortiCare and to the OAuth server so the first API calls skip the TCP + TLS handshake.
+    Errors are logged and ignored.
+    """
+    for url in (FORTICARE_URL, FC_OAUTH):
+        try:
+            self._session.head(url, timeout=self.timeout)
+        except requests.exceptions.RequestException as exp:
+            LOG.debug(">>> Failed to prewarm connection to %s: %s", url, str(exp.args))
+
+
+def close(self) -> None:
+    """Close every pooled connection and stop the background token refresh"""
+    _cancel_refresh(self)
+    self._session.close()
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+
+"""_table.py: Columnar table of assets for inventory analytics."""
+
+import logging
+import math
+from array import array
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, Union
+
+from .asset import Asset, parse_datetime
+from ._product import _iter_products_pages, _products_body
+
+try:
+    import numpy as np
+except ImportError:  # optional, columns stay plain arrays
+    np = None
+
+__author__ = "Charles Prevot"
+__copyright__ = "Copyright 2024"
+
+LOG = logging.getLogger("forticare")
+
+_EPOCH = datetime(1970, 1, 1)
+CATEGORY_COLUMNS = ("productModel", "status", "folderPath")
+DATE_COLUMNS = ("registrationDate", "entitlementEndDate", "warrantyEndDate")
+
+
+def _seconds(date: datetime) -> float:
+    """Convert a datetime to seconds since the epoch, naive datetimes are taken as UTC"""
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return (date - _EPOCH).total_seconds()
+
+
+def _to_seconds(date: str) -> float:
+    """Convert an API date to seconds since the epoch, NaN if missing or invalid"""
+    if not date:
+        return math.nan
+    try:
+        return _seconds(parse_datetime(date))
+    except ValueError:
+        return math.nan
+
+
+def _latest_end(services: list) -> float:
+    return max((_to_seconds(service.get("endDate")) for service in services or []), default=math.nan)
+
+
+class _Categories(object):
+    """Dictionary-encoded string column: one small integer per row, each distinct value stored once"""
+
+    def __init__(self):
+        self.codes = array("l")
+        self.values = []
+        self._index = {}
+
+    def append(self, value) -> None:
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.values)
+            self.values.append(value)
+        self.codes.append(code)
+
+    def code(self, value) -> int:
+        """Get the code of a value, -1 if no row has it"""
+        return self._index.get(value, -1)
+
+    def take(self, indexes: list[int]) -> "_Categories":
+        """Get the rows at the given indexes, sharing the distinct values"""
+        categories = _Categories()
+        categories.values = list(self.values)
+        categories._index = dict(self._index)
+        categories.codes = array("l", (self.codes[index] for index in indexes))
+        return categories
+
+
+class AssetTable(object):
+    """
+    Assets stored column by column, for fleet-wide questions over large inventories.
+
+    Serial numbers are kept as a list, product model, status and folder path are dictionary-encoded,
+    and the registration date and latest entitlement and warranty end dates are float arrays of seconds
+    since the epoch (NaN when missing). With NumPy installed, filters and counts run on NumPy views of
+    these arrays. The raw JSON objects are only kept with `keep_rows=True`, which `Asset` objects are built from.
+    """
+
+    def __init__(self, keep_rows: bool = False):
+        """
+        :param keep_rows: Keep the JSON object of every row, to build `Asset` objects on demand
+        :type keep_rows: bool
+        """
+        self.serialNumber = []
+        self._categories = {name: _Categories() for name in CATEGORY_COLUMNS}
+        self._dates = {name: array("d") for name in DATE_COLUMNS}
+        self._rows = [] if keep_rows else None
+
+    @classmethod
+    def from_responses(cls, responses: Iterable[dict], keep_rows: bool = False) -> "AssetTable":
+        """
+        Build a table from `/products/list` responses, e.g. every page of a query.
+        :param responses: API responses
+        :type responses: Iterable[dict]
+        :param keep_rows: Keep the JSON object of every row, to build `Asset` objects on demand
+        :type keep_rows: bool
+        :return AssetTable: Return the table
+        """
+        table = cls(keep_rows)
+        for results in responses:
+            table.extend(results.get("assets") or [])
+        return table
+
+    @classmethod
+    def from_assets(cls, assets: Iterable[Asset], keep_rows: bool = False) -> "AssetTable":
+        """Build a table from Asset objects"""
+        table = cls(keep_rows)
+        table.extend(asset.to_json() for asset in assets)
+        return table
+
+    def extend(self, rows: Iterable[dict]) -> None:
+        """
+        Append assets given as JSON objects, as found in a `/products/list` response.
+        :param rows: Raw assets
+        :type rows: Iterable[dict]
+        """
+        for row in rows:
+            self.serialNumber.append(row.get("serialNumber", ""))
+            for name in CATEGORY_COLUMNS:
+                self._categories[name].append(row.get(name) or "")
+            self._dates["registrationDate"].append(_to_seconds(row.get("registrationDate")))
+            self._dates["entitlementEndDate"].append(_latest_end(row.get("entitlements")))
+            self._dates["warrantyEndDate"].append(_latest_end(row.get("warrantySupports")))
+            if self._rows is not None:
+                self._rows.append(row)
+
+    def column(self, name: str) -> Union[list, array]:
+        """
+        Get a copy of a column. Dates are seconds since the epoch, as a NumPy array when NumPy is installed.
+        :param name: serialNumber, productModel, status, folderPath, registrationDate, entitlementEndDate
+            or warrantyEndDate
+        :type name: str
+        :return list: Return the column values, one per row
+        """
+        if name == "serialNumber":
+            return list(self.serialNumber)
+        if name in self._categories:
+            categories = self._categories[name]
+            return [categories.values[code] for code in categories.codes]
+        if name in self._dates:
+            values = self._dates[name]
+            return np.array(values, dtype=values.typecode) if np is not None else array(values.typecode, values)
+        raise KeyError(f"Unknown column: {name}")
+
+    @staticmethod
+    def _view(values: array):
+        # zero-copy: NumPy reads the array buffer in place, typecodes are valid NumPy dtypes.
+        # The array can't grow while a view exists, so views must not outlive the method using them.
+        return np.frombuffer(values, dtype=values.typecode) if np is not None else values
+
+    def _take(self, indexes: list[int]) -> "AssetTable":
+        table = AssetTable(keep_rows=self._rows is not None)
+        table.serialNumber = [self.serialNumber[index] for index in indexes]
+        table._categories = {name: categories.take(indexes) for name, categories in self._categories.items()}
+        table._dates = {name: array("d", (values[index] for index in indexes)) for name, values in self._dates.items()}
+        if self._rows is not None:
+            table._rows = [self._rows[index] for index in indexes]
+        return table
+
+    def _indexes(self, mask) -> list[int]:
+        if np is not None:
+            return np.flatnonzero(mask).tolist()
+        return [index for index, selected in enumerate(mask) if selected]
+
+    def where(self, column: str, value) -> "AssetTable":
+        """
+        Keep the rows whose column equals a value, or any of the values if a list, set or tuple is given.
+        :param column: serialNumber, productModel, status or folderPath
+        :type column: str
+        :param value: Value or values to match
+        :return AssetTable: Return a new table
+        """
+        values = set(value) if isinstance(value, (list, set, tuple, frozenset)) else {value}
+        if column == "serialNumber":
+            return self._take([index for index, serial in enumerate(self.serialNumber) if serial in values])
+        if column not in self._categories:
+            raise KeyError(f"Unknown column: {column}")
+        categories = self._categories[column]
+        codes = [categories.code(value) for value in values if categories.code(value) >= 0]
+        if np is not None:
+            mask = np.isin(self._view(categories.codes), codes)
+        else:
+            codes = set(codes)
+            mask = [code in codes for code in categories.codes]
+        return self._take(self._indexes(mask))
+
+    def between(self, column: str, after: datetime = None, before: datetime = None) -> "AssetTable":
+        """
+        Keep the rows whose date falls in [after, before). Rows without a date are dropped.
+        :param column: registrationDate, entitlementEndDate or warrantyEndDate
+        :type column: str
+        :param after: Lower bound, included. None for no bound.
+        :type after: datetime
+        :param before: Upper bound, excluded. None for no bound.
+        :type before: datetime
+        :return AssetTable: Return a new table
+        """
+        if column not in self._dates:
+            raise KeyError(f"Unknown column: {column}")
+        low = _seconds(after) if after is not None else -math.inf
+        high = _seconds(before) if before is not None else math.inf
+        if np is not None:
+            values = self._view(self._dates[column])
+            mask = (values >= low) & (values < high)
+        else:
+            mask = [low <= value < high for value in self._dates[column]]
+        return self._take(self._indexes(mask))
+
+    def expiring(self, before: datetime, after: datetime = None) -> "AssetTable":
+        """Keep the rows whose latest entitlement ends in [after, before)"""
+        return self.between("entitlementEndDate", after, before)
+
+    def group_count(self, *columns: str) -> dict:
+        """
+        Count rows by value of one or more columns, e.g. `group_count("productModel", "folderPath")`.
+        :param columns: productModel, status or folderPath
+        :type columns: str
+        :return dict: Return counts by value, or by tuple of values for several columns
+        """
+        if not columns:
+            raise ValueError("At least one column is required")
+        for column in columns:
+            if column not in self._categories:
+                raise KeyError(f"Unknown column: {column}")
+        categories = [self._categories[column] for column in columns]
+        if np is not None and len(self):
+            codes = np.stack([self._view(category.codes) for category in categories], axis=1)
+            keys, counts = np.unique(codes, axis=0, return_counts=True)
+            grouped = zip(map(tuple, keys.tolist()), counts.tolist())
+        else:
+            grouped = Counter(zip(*(category.codes for category in categories))).items()
+        result = {}
+        for key, count in grouped:
+            values = tuple(category.values[code] for category, code in zip(categories, key))
+            result[values if len(columns) > 1 else values[0]] = count
+        return result
+
+    def _kept_rows(self) -> list[dict]:
+        if self._rows is None:
+            raise ValueError("Rows were not kept. Build the table with keep_rows=True to get Asset objects.")
+        return self._rows
+
+    def asset(self, index: int, lazy: bool = False) -> Asset:
+        """Build the Asset object of one row. Requires `keep_rows=True`."""
+        return Asset(self._kept_rows()[index], lazy)
+
+    def to_assets(self, lazy: bool = False) -> list[Asset]:
+        """Build the Asset objects of every row. Requires `keep_rows=True`."""
+        return [Asset(row, lazy) for row in self._kept_rows()]
+
+    def __iter__(self) -> Iterator[Asset]:
+        return (Asset(row, lazy=True) for row in self._kept_rows())
+
+    def __len__(self) -> int:
+        return len(self.serialNumber)
+
+    def __str__(self) -> str:
+        return f"AssetTable({len(self)} assets)"
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+def get_products_table(
+    self,
+    expire_before: datetime,
+    serial_number: str = "",
+    product_model: str = "",
+    status: str = "Registered",
+    prefetch: bool = False,
+    keep_rows: bool = False,
+) -> AssetTable:
+    """
+    Fetch every page of the product list into an AssetTable, without building Asset objects.
+    Same filters as `get_products`.
+    :param expire_before: Date time in ISO 8601 format
+    :type expire_before: datetime
+    :param serial_number: Serial number or serial number search pattern
+    :type serial_number: str
+    :param product_model: Product model name
+    :type product_model: str
+    :param status: Allowed values are Registered and Pending. Default value is Registered.
+    :type status: str
+    :param prefetch: Fetch the next page in the background while the current one is stored
+    :type prefetch: bool
+    :param keep_rows: Keep the JSON object of every asset, to build `Asset` objects on demand
+    :type keep_rows: bool
+    :return AssetTable: Return the assets
+    """
+    body = _products_body(expire_before, serial_number, product_model, status)
+    LOG.info("> Retriving assets table...")
+    try:
+        return AssetTable.from_responses(_iter_products_pages(self, body, prefetch), keep_rows)
+    except Exception as exp:
+        LOG.error(">>> Failed to retrive assets: %s", str(exp.args))
+        raise exp
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""_token_store.py: Persistent API token cache."""
+
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+__author__ = "Charles Prevot"
+__copyright__ = "Copyright 2024"
+
+LOG = logging.getLogger("forticare")
+
+
+def _default_path() -> str:
+    cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_dir, "forticare", "tokens.json")
+
+
+class FileTokenStore(object):
+    """
+    Keep API tokens on disk, keyed by API user, so short-lived processes can skip the OAuth round trip.
+    The file is only readable by its owner.
+    """
+
+    def __init__(self, path: str = None):
+        """
+        :param path: Token file. Default is $XDG_CACHE_HOME/forticare/tokens.json
+        :type path: str
+        """
+        self._path = path if path is not None else _default_path()
+
+    @property
+    def path(self) -> str:
+        """Get token file path"""
+        return self._path
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self._path)), mode=0o700, exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(self._path + ".lock", "a", encoding="utf-8") as _f:
+            fcntl.flock(_f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(_f, fcntl.LOCK_UN)
+
+    def _read(self) -> dict:
+        try:
+            with open(self._path, "r", encoding="utf-8") as _f:
+                return json.load(_f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            LOG.warning(">>> Ignoring corrupted token file %s", self._path)
+            return {}
+
+    def _write(self, tokens: dict) -> None:
+        # mkstemp creates the file with 0600 permissions, os.replace swaps it atomically
+        _fd, _tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self._path)), prefix=".tokens")
+        try:
+            with os.fdopen(_fd, "w", encoding="utf-8") as _f:
+                json.dump(tokens, _f)
+            os.replace(_tmp, self._path)
+        except Exception:
+            os.unlink(_tmp)
+            raise
+
+    def load(self, api_user: str) -> tuple:
+        """
+        Get the stored token of an API user.
+        :param api_user: API user
+        :type api_user: str
+        :return tuple: Return (token, expires_at), or None if no unexpired token is stored
+        """
+        entry = self._read().get(str(api_user))
+        if not entry or not entry.get("token"):
+            return None
+        expires_at = entry.get("expires_at")
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return entry["token"], expires_at
+
+    def save(self, api_user: str, token: str, expires_at: float = None) -> None:
+        """
+        Store the token of an API user.
+        :param api_user: API user
+        :type api_user: str
+        :param token: Bearer token
+        :type token: str
+        :param expires_at: Token expiry as a POSIX timestamp
+        :type expires_at: float
+        """
+        with self._locked():
+            tokens = self._read()
+            tokens[str(api_user)] = {"token": token, "expires_at": expires_at}
+            self._write(tokens)
+
+    def delete(self, api_user: str) -> None:
+        """Forget the token of an API user"""
+        with self._locked():
+            tokens = self._read()
+            if tokens.pop(str(api_user), None) is not None:
+                self._write(tokens)
+
+    def __str__(self) -> str:
+        return f"FileTokenStore({self._path})"
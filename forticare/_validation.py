@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+"""_validation.py: Local pre-flight validation of registration batches."""
+
+import re
+from typing import Iterable, Tuple, Union
+
+from ._constants import SERIAL_ALPHABET, SERIAL_LENGTH
+from .location import Location
+from .registration_unit import LicenseRegistrationUnit, ProductRegistrationUnit, ServiceRegistrationUnit
+
+__author__ = "Charles Prevot"
+__copyright__ = "Copyright 2024"
+
+
+SERIAL_PATTERN = re.compile(f"[{re.escape(SERIAL_ALPHABET)}]{{{SERIAL_LENGTH}}}")
+# e.g. K06V2-U795H-9PKR7-2TXNM-V8GL6B
+REGISTRATION_CODE_PATTERN = re.compile(r"[0-9A-Z]+(?:-[0-9A-Z]+)+")
+
+
+class ValidationReport(object):
+    """Outcome of `validate_units`: the issues found and the units and locations left valid"""
+
+    def __init__(self):
+        self.issues = []
+        self.valid_units = []
+        self.valid_locations = []
+        self.invalid_units = []
+
+    def add(self, index: int, key: str, field: str, message: str) -> None:
+        """Record an issue. `index` is the unit position in the batch, None for a location."""
+        self.issues.append({"index": index, "key": key, "field": field, "message": message})
+
+    @property
+    def ok(self) -> bool:
+        """Whether the batch has no issue"""
+        return not self.issues
+
+    def to_json(self) -> dict:
+        """Return JSON object"""
+        return {
+            "ok": self.ok,
+            "valid": len(self.valid_units),
+            "invalid": len(self.invalid_units),
+            "issues": self.issues,
+        }
+
+    def __len__(self) -> int:
+        return len(self.issues)
+
+    def __str__(self) -> str:
+        return f"ValidationReport(valid={len(self.valid_units)}, invalid={len(self.invalid_units)})"
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+def _unit_issues(unit, serial_pattern: re.Pattern, code_pattern: re.Pattern) -> list[Tuple[str, str]]:
+    """Check the fields of one unit, return (field, message) tuples"""
+    issues = []
+    if isinstance(unit, ServiceRegistrationUnit):
+        if not unit.contractNumber:
+            issues.append(("contractNumber", "Contract number is empty"))
+        return issues
+    if isinstance(unit, LicenseRegistrationUnit):
+        if not unit.licenseRegistrationCode:
+            issues.append(("licenseRegistrationCode", "Registration code is empty"))
+        elif not code_pattern.fullmatch(unit.licenseRegistrationCode):
+            issues.append(("licenseRegistrationCode", f"Malformed registration code: {unit.licenseRegistrationCode}"))
+        if unit.serialNumber and not serial_pattern.fullmatch(unit.serialNumber):
+            issues.append(("serialNumber", f"Malformed serial number: {unit.serialNumber}"))
+        return issues
+    if isinstance(unit, ProductRegistrationUnit):
+        if not unit.serialNumber:
+            issues.append(("serialNumber", "Serial number is empty"))
+        elif not serial_pattern.fullmatch(unit.serialNumber):
+            issues.append(("serialNumber", f"Malformed serial number: {unit.serialNumber}"))
+        return issues
+    return [("", f"Unsupported registration unit: {unit}")]
+
+
+def _unit_keys(unit) -> list[Tuple[str, str]]:
+    """Values that must be unique in a batch, as (field, value) tuples"""
+    if isinstance(unit, ServiceRegistrationUnit):
+        return [("contractNumber", unit.contractNumber)]
+    keys = []
+    if getattr(unit, "serialNumber", ""):
+        keys.append(("serialNumber", unit.serialNumber))
+    if getattr(unit, "licenseRegistrationCode", ""):
+        keys.append(("licenseRegistrationCode", unit.licenseRegistrationCode))
+    return keys
+
+
+def validate_units(
+    units: Iterable,
+    locations: list[Tuple[str, Location]] = [],
+    serial_pattern: Union[str, re.Pattern] = SERIAL_PATTERN,
+    code_pattern: Union[str, re.Pattern] = REGISTRATION_CODE_PATTERN,
+) -> ValidationReport:
+    """
+    Check a registration batch locally, in one pass, before sending it.
+    Empty or malformed serial numbers and registration codes, values used by more than one unit
+    (the first unit keeps them) and locations of serial numbers missing from the batch are reported.
+    :param units: Product, license or service registration units
+    :type units: Iterable
+    :param locations: Locations, as given to `register_product`
+    :type locations: list[Tuple[serial_number: <string>, location: <Location>]]
+    :param serial_pattern: Regular expression a serial number must match
+    :type serial_pattern: str or re.Pattern
+    :param code_pattern: Regular expression a license registration code must match
+    :type code_pattern: str or re.Pattern
+    :return ValidationReport: Return the issues found, `valid_units` and `valid_locations` are ready to send
+    """
+    serial_pattern = re.compile(serial_pattern)
+    code_pattern = re.compile(code_pattern)
+    report = ValidationReport()
+    seen = {}
+    valid_serials = set()
+    for index, unit in enumerate(units):
+        issues = _unit_issues(unit, serial_pattern, code_pattern)
+        for field, value in _unit_keys(unit):
+            first = seen.setdefault((field, value), index)
+            if first != index:
+                issues.append((field, f"Duplicate {field} {value}, first used by unit {first}"))
+        key = getattr(unit, "serialNumber", "") or getattr(unit, "licenseRegistrationCode", "")
+        key = key or getattr(unit, "contractNumber", "")
+        for field, message in issues:
+            report.add(index, key, field, message)
+        if issues:
+            report.invalid_units.append(unit)
+        else:
+            report.valid_units.append(unit)
+            if getattr(unit, "serialNumber", ""):
+                valid_serials.add(unit.serialNumber)
+
+    located = set()
+    for serial_number, location in locations:
+        if serial_number in valid_serials and serial_number not in located:
+            located.add(serial_number)
+            report.valid_locations.append((serial_number, location))
+        elif serial_number in located:
+            report.add(None, serial_number, "location", "More than one location for this serial number")
+        elif ("serialNumber", serial_number) in seen:
+            # the unit is invalid, its issues are already reported
+            continue
+        else:
+            report.add(None, serial_number, "location", "No registration unit for this serial number")
+    return report
@@ -3,23 +3,65 @@
 """asset.py: Objects used in FortiCare API"""
 
 from datetime import datetime
+from functools import lru_cache
 from typing import Union
 
 __author__ = "Charles Prevot"
 __copyright__ = "Copyright 2024"
 
+ISO_FORMAT = "%Y-%m-%dT%H:%M:%S"
+DATE_FORMATS = (ISO_FORMAT, "%Y-%m-%d %H:%M:%S%z")
+_field_formats = {}  # last format that matched, by field name
+
+
+def _parse_iso(date: str) -> datetime:
+    """Parse `YYYY-MM-DDTHH:MM:SS` without strptime, return None if the date has another format"""
+    if len(date) != 19 or date[4] != "-" or date[7] != "-" or date[10] != "T" or date[13] != ":" or date[16] != ":":
+        return None
+    digits = date[0:4] + date[5:7] + date[8:10] + date[11:13] + date[14:16] + date[17:19]
+    if not (digits.isascii() and digits.isdecimal()):
+        return None
+    try:
+        # the layout is checked above: fromisoformat reads it like strptime(date, ISO_FORMAT), much faster
+        return datetime.fromisoformat(date)
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=4096)
+def _parse_datetime(date: str, field: str) -> datetime:
+    # services share a handful of start and end dates: most calls are cache hits
+    remembered = _field_formats.get(field, ISO_FORMAT)
+    for _f in (remembered,) + tuple(_f for _f in DATE_FORMATS if _f != remembered):
+        parsed = _parse_iso(date) if _f == ISO_FORMAT else None
+        if parsed is None:
+            # strptime also accepts what the fast path doesn't, e.g. dates that are not zero-padded
+            try:
+                parsed = datetime.strptime(date, _f)
+            except ValueError:
+                pass
+        if parsed is not None:
+            _field_formats[field] = _f
+            return parsed
+    raise ValueError(f"Invalid date format: {date}")
+
 
-def parse_datetime(date: str) -> datetime:
-    """Parse date string to datetime object"""
+def parse_datetime(date: str, field: str = "") -> datetime:
+    """
+    Parse date string to datetime object.
+    Parsed dates are cached, returned datetime objects are shared (they are immutable).
+    :param date: Date string
+    :type date: str
+    :param field: Name of the field holding the date, its last matching format is tried first
+    :type field: str
+    :return datetime: Return the parsed date
+    """
     if date is None:
         raise ValueError("Invalid date format: None")
-    _formats = ["%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S%z"]
-    for _f in _formats:
-        try:
-            return datetime.strptime(str(date), _f)
-        except ValueError:
-            continue
-    raise ValueError(f"Invalid date format: {date}")
+    return _parse_datetime(str(date), field)
+
+
+_UNSET = object()  # lazy Asset attribute not built yet
 
 
 # {
@@ -31,6 +73,8 @@ def parse_datetime(date: str) -> datetime:
 class License(object):
     """FortiCare License object"""
 
+    __slots__ = ("licenseNumber", "licenseSKU", "serialNumber", "status")
+
     def __init__(self, json: dict):
         self.licenseNumber = json.get("licenseNumber", "")
         self.licenseSKU = json.get("licenseSKU", "")
@@ -64,9 +108,11 @@ class License(object):
 class Service(object):
     """FortiCare Entitlement or Warranty object"""
 
+    __slots__ = ("startDate", "endDate", "level", "levelDesc", "type", "typeDesc")
+
     def __init__(self, json: dict):
-        self.startDate = parse_datetime(json.get("startDate", None))
-        self.endDate = parse_datetime(json.get("endDate", None))
+        self.startDate = parse_datetime(json.get("startDate", None), "startDate")
+        self.endDate = parse_datetime(json.get("endDate", None), "endDate")
         self.level = json.get("level")
         self.levelDesc = json.get("levelDesc")
         self.type = json.get("type")
@@ -95,14 +141,16 @@ class Service(object):
 class Term(object):
     """FortiCare Term object"""
 
+    __slots__ = ("startDate", "endDate", "supportType")
+
     def __init__(self, json: dict) -> None:
         # {
         #     "endDate": "2021-09-23T00:00:00",
         #     "startDate": "2020-09-23T00:00:00",
         #     "supportType": "Telephone Support",
         # },
-        self.startDate = parse_datetime(json.get("startDate", None))
-        self.endDate = parse_datetime(json.get("endDate", None))
+        self.startDate = parse_datetime(json.get("startDate", None), "startDate")
+        self.endDate = parse_datetime(json.get("endDate", None), "endDate")
         self.supportType = json.get("supportType", "")
 
     def to_json(self) -> dict:
@@ -123,6 +171,8 @@ class Term(object):
 class Contract(object):
     """FortiCare Contract object"""
 
+    __slots__ = ("contractNumber", "sku", "terms")
+
     def __init__(self, json: dict) -> None:
         # {
         #     "contractNumber": "5762CL381100",
@@ -172,6 +222,8 @@ class Contract(object):
 class AssetGroup(object):
     """FortiCare Asset Group object"""
 
+    __slots__ = ("assetGroupId", "assetGroup")
+
     def __init__(self, json: dict) -> None:
         # {"assetGroupId": "<integer>", "assetGroup": "<string>"},
         self.assetGroupId = json.get("assetGroupId", 0)
@@ -192,44 +244,133 @@ class AssetGroup(object):
 
 
 class Asset(object):
-    """FortiCare Asset object"""
-
-    def __init__(self, json: dict):
+    """
+    FortiCare Asset object
+
+    With `lazy=True`, the registration date and the child objects (entitlements, warranty supports,
+    asset groups, contracts and licenses) are only built on first access, then cached.
+    """
+
+    __slots__ = (
+        "description",
+        "isDecommissioned",
+        "productModel",
+        "serialNumber",
+        "productModelEor",
+        "productModelEos",
+        "location",
+        "partner",
+        "folderId",
+        "folderPath",
+        "status",
+        "_json",
+        "_registrationDate",
+        "_entitlements",
+        "_warrantySupports",
+        "_assetGroups",
+        "_contracts",
+        "_licenses",
+    )
+
+    def __init__(self, json: dict, lazy: bool = False):
         self.description = json.get("description", "")
         self.isDecommissioned = json.get("isDecommissioned", "")
         self.productModel = json.get("productModel", "")
-        self.registrationDate = parse_datetime(json.get("registrationDate", None))
         self.serialNumber = json.get("serialNumber", "")
-        self.entitlements = []
-        for entitlement in json.get("entitlements", []):
-            self.entitlements.append(Service(entitlement))
-        __warranty_supports = json.get("warrantySupports", [])
-        self.warrantySupports = []
-        if __warranty_supports:
-            for warranty_support in __warranty_supports:
-                self.warrantySupports.append(Service(warranty_support))
-        __asset_groups = json.get("assetGroups", [])
-        self.assetGroups = []
-        if __asset_groups:
-            for asset_group in __asset_groups:
-                self.assetGroups.append(AssetGroup(asset_group))
-        __contracts = json.get("contracts", [])
-        self.contracts = []
-        if __contracts:
-            for contract in json.get("contracts", []):
-                self.contracts.append(Contract(contract))
         self.productModelEor = json.get("productModelEoR", "")
         self.productModelEos = json.get("productModelEoS", "")
-        __licenses = json.get("licenses", [])
-        self.licenses = []
-        if __licenses:
-            for license in __licenses:
-                self.licenses.append(License(license))
         self.location = json.get("location", "")
         self.partner = json.get("partner", "")
         self.folderId = json.get("folderId", "")
         self.folderPath = json.get("folderPath", "")
         self.status = json.get("status", "")
+        self._json = json
+        self._registrationDate = _UNSET
+        self._entitlements = _UNSET
+        self._warrantySupports = _UNSET
+        self._assetGroups = _UNSET
+        self._contracts = _UNSET
+        self._licenses = _UNSET
+        if not lazy:
+            self._build()
+
+    def _build(self) -> None:
+        """Build every lazy attribute, then drop the raw response"""
+        for name in ("registrationDate", "entitlements", "warrantySupports", "assetGroups", "contracts", "licenses"):
+            getattr(self, name)
+        self._json = None
+
+    @property
+    def registrationDate(self) -> datetime:
+        """Get registration date"""
+        if self._registrationDate is _UNSET:
+            self._registrationDate = parse_datetime(self._json.get("registrationDate", None), "registrationDate")
+        return self._registrationDate
+
+    @registrationDate.setter
+    def registrationDate(self, registration_date: datetime):
+        """Set registration date"""
+        self._registrationDate = registration_date
+
+    @property
+    def entitlements(self) -> list[Service]:
+        """Get entitlements"""
+        if self._entitlements is _UNSET:
+            self._entitlements = [Service(entitlement) for entitlement in self._json.get("entitlements") or []]
+        return self._entitlements
+
+    @entitlements.setter
+    def entitlements(self, entitlements: list[Service]):
+        """Set entitlements"""
+        self._entitlements = entitlements
+
+    @property
+    def warrantySupports(self) -> list[Service]:
+        """Get warranty supports"""
+        if self._warrantySupports is _UNSET:
+            self._warrantySupports = [Service(warranty) for warranty in self._json.get("warrantySupports") or []]
+        return self._warrantySupports
+
+    @warrantySupports.setter
+    def warrantySupports(self, warranty_supports: list[Service]):
+        """Set warranty supports"""
+        self._warrantySupports = warranty_supports
+
+    @property
+    def assetGroups(self) -> list[AssetGroup]:
+        """Get asset groups"""
+        if self._assetGroups is _UNSET:
+            self._assetGroups = [AssetGroup(asset_group) for asset_group in self._json.get("assetGroups") or []]
+        return self._assetGroups
+
+    @assetGroups.setter
+    def assetGroups(self, asset_groups: list[AssetGroup]):
+        """Set asset groups"""
+        self._assetGroups = asset_groups
+
+    @property
+    def contracts(self) -> list[Contract]:
+        """Get contracts"""
+        if self._contracts is _UNSET:
+            self._contracts = [Contract(contract) for contract in self._json.get("contracts") or []]
+        return self._contracts
+
+    @contracts.setter
+    def contracts(self, contracts: list[Contract]):
+        """Set contracts"""
+        self._contracts = contracts
+
+    @property
+    def licenses(self) -> list[License]:
+        """Get licenses"""
+        if self._licenses is _UNSET:
+            self._licenses = [License(license) for license in self._json.get("licenses") or []]
+        return self._licenses
+
+    @licenses.setter
+    def licenses(self, licenses: list[License]):
+        """Set licenses"""
+        self._licenses = licenses
 
     def to_json(self) -> dict:
         """Get object as json"""
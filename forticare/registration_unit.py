@@ -2,6 +2,8 @@
 
 """registration_unit.py: Objects used in FortiCare API"""
 
+from .asset import Asset
+
 __author__ = "Charles Prevot"
 __copyright__ = "Copyright 2024"
 
@@ -206,10 +208,34 @@ class ServiceRegistrationUnit(object):
         return f"ServiceRegistrationUnits(contract={self.contractNumber})"
 
     def __eq__(self, other) -> bool:
-        return self.contractNumber == other.contratNumber
+        return self.contractNumber == other.contractNumber
 
     def __hash__(self) -> int:
         return hash(self.contractNumber)
 
     def __repr__(self) -> str:
         return self.__str__()
+
+
+class RegistrationResult(object):
+    """Outcome of one registration unit in a bulk registration"""
+
+    def __init__(self, serialNumber: str, registered: bool = False, message: str = "", asset: Asset = None):
+        self.serialNumber = serialNumber
+        self.registered = registered
+        self.message = message
+        self.asset = asset
+
+    def to_json(self) -> dict:
+        """Return JSON object"""
+        return {
+            "serialNumber": self.serialNumber,
+            "registered": self.registered,
+            "message": self.message,
+        }
+
+    def __str__(self) -> str:
+        return f"RegistrationResult(sn={self.serialNumber}, registered={self.registered})"
+
+    def __repr__(self) -> str:
+        return self.__str__()
@@ -18,4 +18,6 @@ setup(
     url="https://github.com/cprevot93/forticare.git",
     license=license,
     packages=find_packages(exclude=("tests", "docs")),
+    install_requires=["requests"],
+    extras_require={"async": ["httpx"], "numpy": ["numpy"]},
 )
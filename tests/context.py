@@ -6,12 +6,26 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")
 
 from forticare import (
     Asset,
+    AssetTable,
+    AsyncFortiCare,
+    ExpiryIndex,
     Service,
     FortiCare,
     Location,
     License,
     LicenseRegistrationUnit,
     ProductRegistrationUnit,
+    RegistrationResult,
+    FileRateLimitBackend,
+    FileTokenStore,
+    LicenseStore,
+    load_units,
+    RateLimiter,
+    RegistrationJournal,
+    ResponseCache,
+    RetryPolicy,
     ServiceRegistrationUnit,
+    validate_units,
 )
+from forticare.asset import parse_datetime
 from tests.env import API_USERNAME, API_PASSWORD
@@ -5,16 +5,32 @@ from tests.context import (
     API_USERNAME,
     API_PASSWORD,
     Asset,
+    AssetTable,
+    ExpiryIndex,
     FortiCare,
+    LicenseRegistrationUnit,
     Location,
     ProductRegistrationUnit,
+    RegistrationJournal,
+    RegistrationResult,
+    Service,
+    load_units,
+    parse_datetime,
+    validate_units,
 )
+import io
 import os
+import tempfile
 import json
 import unittest
 import requests
 import datetime as dt
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class RegisterProductUnitTest(unittest.TestCase):
 
@@ -266,7 +282,7 @@ class RegisterProductE2ETestCase(unittest.TestCase):
         response._content = bytes(json.dumps(data), "utf-8")
         response.headers = {"Content-Type": "application/json"}
 
-        with patch.object(requests, "post", return_value=response):
+        with patch.object(requests.Session, "post", return_value=response):
             with self.assertRaises(requests.exceptions.HTTPError) as e:
                 res = self.forticare.register_product(units)
             self.assertEqual(
@@ -287,7 +303,7 @@ class RegisterProductE2ETestCase(unittest.TestCase):
         response._content = bytes(json.dumps(data), "utf-8")
         response.headers = {"Content-Type": "application/json"}
 
-        with patch.object(requests, "post", return_value=response):
+        with patch.object(requests.Session, "post", return_value=response):
             with self.assertRaises(requests.exceptions.HTTPError) as e:
                 res = self.forticare.register_product(units)
             self.assertEqual(
@@ -307,9 +323,650 @@ class RegisterProductE2ETestCase(unittest.TestCase):
         response._content = bytes(json.dumps(data), "utf-8")
         response.headers = {"Content-Type": "application/json"}
 
-        with patch.object(requests, "post", return_value=response):
+        with patch.object(requests.Session, "post", return_value=response):
             with self.assertRaises(requests.exceptions.HTTPError) as e:
                 res = self.forticare.register_product(units)
             self.assertEqual(
                 e.exception.args[1], "POST /products/register Invalid cloud key provided for registration units[0]. "
             )
+
+
+class ProductDetailsBulkTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.forticare = FortiCare(API_USERNAME, API_PASSWORD)
+
+    def test_get_products_details(self):
+        def _details(serial_number):
+            if serial_number == "FG40FTK190001XXX":
+                raise requests.exceptions.HTTPError(400, "POST /products/details Invalid serial number.")
+            return Asset({"serialNumber": serial_number, "registrationDate": "2024-01-18T00:13:44"})
+
+        serials = ["FGT60F0000000001", "FG40FTK190001XXX", "FGT60F0000000002", "FGT60F0000000001"]
+        with patch.object(self.forticare, "get_product_details", side_effect=_details) as mock_method:
+            res = list(self.forticare.get_products_details(serials, max_workers=2))
+
+        self.assertEqual(mock_method.call_count, 3)
+        self.assertEqual([sn for sn, _ in res], ["FGT60F0000000001", "FG40FTK190001XXX", "FGT60F0000000002"])
+        self.assertTrue(isinstance(res[0][1], Asset))
+        self.assertTrue(isinstance(res[1][1], requests.exceptions.HTTPError))
+        self.assertEqual(res[2][1].serialNumber, "FGT60F0000000002")
+
+
+class IterProductsTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.forticare = FortiCare(API_USERNAME, API_PASSWORD)
+
+    def _page(self, page_number, total_pages):
+        return {
+            "status": 0,
+            "assets": [
+                {"serialNumber": f"FGT60F00000{page_number}00{i}", "registrationDate": "2024-01-18T00:13:44"}
+                for i in range(2)
+            ],
+            "pageNumber": page_number,
+            "totalPages": total_pages,
+        }
+
+    def test_iter_products(self):
+        for prefetch in (False, True):
+            with self.subTest(prefetch=prefetch):
+                pages = [self._page(1, 3), self._page(2, 3), self._page(3, 3)]
+                with patch.object(self.forticare, "_post", side_effect=pages) as mock_method:
+                    res = list(self.forticare.iter_products(dt.datetime(2028, 1, 1), prefetch=prefetch))
+
+                self.assertEqual(len(res), 6)
+                self.assertTrue(all(isinstance(asset, Asset) for asset in res))
+                self.assertEqual(res[-1].serialNumber, "FGT60F000003001")
+                self.assertEqual(
+                    [call.args[1]["pageNumber"] for call in mock_method.call_args_list],
+                    [1, 2, 3],
+                )
+
+    def test_iter_products_is_lazy(self):
+        pages = [self._page(1, 3), self._page(2, 3), self._page(3, 3)]
+        with patch.object(self.forticare, "_post", side_effect=pages) as mock_method:
+            iterator = self.forticare.iter_products(dt.datetime(2028, 1, 1))
+            next(iterator)
+            self.assertEqual(mock_method.call_count, 1)
+
+
+class SweepInventoryTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.forticare = FortiCare(API_USERNAME, API_PASSWORD)
+
+    def test_sweep_inventory(self):
+        inventory = ["FGT60F0000000001", "FGT60F0000000002", "FGT60F0000000003", "FWF40F0000000001"]
+
+        def _post(endpoint, body):
+            prefix = body["serialNumber"].rstrip("*")
+            matches = [{"serialNumber": sn, "registrationDate": "2024-01-18T00:13:44"} for sn in inventory]
+            matches = [asset for asset in matches if asset["serialNumber"].startswith(prefix)]
+            # two assets per page
+            total_pages = max(1, (len(matches) + 1) // 2)
+            page = matches[(body["pageNumber"] - 1) * 2 : body["pageNumber"] * 2]
+            return {"status": 0, "assets": page, "pageNumber": body["pageNumber"], "totalPages": total_pages}
+
+        with patch.object(self.forticare, "_post", side_effect=_post) as mock_method:
+            res = self.forticare.sweep_inventory(dt.datetime(2028, 1, 1), prefixes=["F", "FGT"], max_pages=1)
+
+        self.assertEqual([asset.serialNumber for asset in res], inventory)
+        patterns = [call.args[1]["serialNumber"] for call in mock_method.call_args_list]
+        self.assertIn("FG*", patterns)
+        self.assertIn("FW*", patterns)
+
+
+class RegisterProductsBulkTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.forticare = FortiCare(API_USERNAME, API_PASSWORD)
+        self.forticare.token = "toto"
+
+    def _response(self, status_code, name):
+        with open(os.path.join(os.path.dirname(__file__), "data", name), encoding="utf-8") as _f:
+            data = json.load(_f)
+        response = requests.Response()
+        response.request = requests.Request()
+        response.status_code = status_code
+        response._content = bytes(json.dumps(data), "utf-8")
+        return response
+
+    def test_register_products_bulk(self):
+        def _post(url, **kwargs):
+            serials = [unit["serialNumber"] for unit in kwargs["json"]["registrationUnits"]]
+            if "FG40FTK190001XXX" in serials:
+                return self._response(400, "product_already_registered.json")
+            if "FG40FTK190002XXX" in serials:
+                return self._response(400, "product_invalid_cloud_key.json")
+            response = requests.Response()
+            response.status_code = 200
+            assets = [
+                {"serialNumber": sn, "status": "Registered", "registrationDate": "2024-01-18T00:13:44"}
+                for sn in serials
+            ]
+            response._content = bytes(json.dumps({"status": 0, "assets": assets}), "utf-8")
+            return response
+
+        serials = ["FGT60F0000000001", "FGT60F0000000002", "FG40FTK190001XXX", "FGT60F0000000003", "FG40FTK190002XXX"]
+        units = [ProductRegistrationUnit(serialNumber=sn, cloudKey="ABC") for sn in serials]
+        locations = [("FGT60F0000000002", Location("Test", "Test", "Test")), ("FG40FTK190002XXX", Location("Other"))]
+        with patch.object(requests.Session, "post", side_effect=_post) as mock_method:
+            res = self.forticare.register_products_bulk(units, locations, chunk_size=2, max_workers=2)
+
+        self.assertEqual(mock_method.call_count, 3)
+        bodies = {
+            call.kwargs["json"]["registrationUnits"][0]["serialNumber"]: call.kwargs["json"]
+            for call in mock_method.call_args_list
+        }
+        self.assertEqual(
+            bodies["FGT60F0000000001"]["locations"], [{"address": "Test", "postalCode": "Test", "countryCode": "Test"}]
+        )
+        self.assertEqual(bodies["FGT60F0000000001"]["registrationUnits"][1]["location"], {"ref": "#/locations/0"})
+        self.assertNotIn("locations", bodies["FG40FTK190001XXX"])
+        self.assertEqual(bodies["FG40FTK190002XXX"]["locations"], [{"address": "Other"}])
+
+        self.assertEqual(list(res), serials)
+        self.assertTrue(all(isinstance(result, RegistrationResult) for result in res.values()))
+        self.assertTrue(res["FGT60F0000000001"].registered)
+        self.assertTrue(isinstance(res["FGT60F0000000001"].asset, Asset))
+        self.assertTrue(res["FGT60F0000000002"].registered)
+        self.assertFalse(res["FG40FTK190001XXX"].registered)
+        self.assertEqual(
+            res["FG40FTK190001XXX"].message,
+            "Product-> Product already registered, but no contract associated with request. Please check again.",
+        )
+        self.assertFalse(res["FGT60F0000000003"].registered)
+        self.assertTrue(res["FGT60F0000000003"].message.startswith("Not registered, batch rejected"))
+        self.assertFalse(res["FG40FTK190002XXX"].registered)
+        self.assertEqual(
+            res["FG40FTK190002XXX"].message,
+            "POST /products/register Invalid cloud key provided for registration units[0]. ",
+        )
+
+    def test_register_products_bulk_timeout(self):
+        units = [ProductRegistrationUnit(serialNumber=sn) for sn in ("FGT60F0000000001", "FGT60F0000000002")]
+        with patch.object(requests.Session, "post", side_effect=requests.exceptions.ReadTimeout("read timed out")):
+            res = self.forticare.register_products_bulk(units)
+        # the batch may have gone through: it is not reported as rejected
+        for result in res.values():
+            self.assertFalse(result.registered)
+            self.assertEqual(result.message, "Outcome unknown, check before submitting again: read timed out")
+
+
+class RegisterProductBodyTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.forticare = FortiCare(API_USERNAME, API_PASSWORD)
+
+    def test_register_product_shared_locations(self):
+        units = [ProductRegistrationUnit(serialNumber=f"FGT60F000000000{i}") for i in range(4)]
+        headquarters = Location("1234 Wall Street", "34510", "US", company="FortiTEST")
+        locations = [
+            ("FGT60F0000000000", headquarters),
+            ("FGT60F0000000001", Location("1234 Wall Street", "34510", "US", company="FortiTEST")),
+            ("FGT60F0000000003", Location("1 rue de la paix", "75000", "FR")),
+            ("FGT60F0000000009", headquarters),
+        ]
+        _ret = {"status": 0, "assets": []}
+        with patch.object(self.forticare, "_post", return_value=_ret) as mock_method:
+            self.forticare.register_product(units, locations)
+
+        body = mock_method.call_args.args[1]
+        self.assertEqual(
+            body["locations"],
+            [headquarters.to_json(), {"address": "1 rue de la paix", "postalCode": "75000", "countryCode": "FR"}],
+        )
+        self.assertEqual(
+            [unit.get("location") for unit in body["registrationUnits"]],
+            [{"ref": "#/locations/0"}, {"ref": "#/locations/0"}, None, {"ref": "#/locations/1"}],
+        )
+
+    def test_register_product_same_address_other_contact(self):
+        units = [ProductRegistrationUnit(serialNumber=f"FGT60F000000000{i}") for i in range(2)]
+        acme = Location("1234 Wall Street", "34510", "US", company="ACME", email="it@acme.com")
+        globex = Location("1234 Wall Street", "34510", "US", company="Globex", email="it@globex.com")
+        locations = [("FGT60F0000000000", acme), ("FGT60F0000000001", globex)]
+        _ret = {"status": 0, "assets": []}
+        with patch.object(self.forticare, "_post", return_value=_ret) as mock_method:
+            self.forticare.register_product(units, locations)
+
+        body = mock_method.call_args.args[1]
+        self.assertEqual(body["locations"], [acme.to_json(), globex.to_json()])
+        self.assertEqual(
+            [unit["location"] for unit in body["registrationUnits"]],
+            [{"ref": "#/locations/0"}, {"ref": "#/locations/1"}],
+        )
+
+
+class RegistrationJournalTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.forticare = FortiCare(API_USERNAME, API_PASSWORD)
+        self.forticare.token = "toto"
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.journal = RegistrationJournal(os.path.join(self.tmpdir.name, "journal.db"))
+
+    def tearDown(self) -> None:
+        self.journal.close()
+        self.tmpdir.cleanup()
+
+    def test_resume_bulk_registration(self):
+        submitted = []
+
+        def _post(url, **kwargs):
+            response = requests.Response()
+            response.status_code = 200
+            if url.endswith("/products/details"):
+                sn = kwargs["json"]["serialNumber"]
+                asset = {"serialNumber": sn, "status": "Registered", "registrationDate": "2024-01-18T00:13:44"}
+                response._content = bytes(json.dumps({"status": 0, "assetDetails": asset}), "utf-8")
+                return response
+            serials = [unit["serialNumber"] for unit in kwargs["json"]["registrationUnits"]]
+            submitted.extend(serials)
+            assets = [
+                {"serialNumber": sn, "status": "Registered" if sn != "FGT60F0000000002" else "Rejected"}
+                for sn in serials
+            ]
+            response._content = bytes(json.dumps({"status": 0, "assets": assets}), "utf-8")
+            return response
+
+        serials = ["FGT60F0000000001", "FGT60F0000000002", "FGT60F0000000003", "FGT60F0000000004"]
+        units = [ProductRegistrationUnit(serialNumber=sn) for sn in serials]
+        # a previous run died right after sending FGT60F0000000004
+        self.journal.record(units[3:])
+        self.journal.mark_submitted(["product:FGT60F0000000004"])
+        with patch.object(requests.Session, "post", side_effect=_post):
+            res = self.forticare.register_products_bulk(units, chunk_size=2, journal=self.journal)
+        self.assertEqual(sorted(submitted), serials[:3])
+        self.assertEqual(list(res), serials)
+        self.assertFalse(res["FGT60F0000000002"].registered)
+        self.assertTrue(res["FGT60F0000000004"].registered)
+        self.assertEqual(self.journal.summary(), {"registered": 3, "failed": 1})
+
+        # resuming only submits what is not registered yet
+        submitted.clear()
+        with patch.object(requests.Session, "post", side_effect=_post):
+            res = self.forticare.register_products_bulk(units, chunk_size=2, journal=self.journal)
+        self.assertEqual(submitted, ["FGT60F0000000002"])
+        self.assertTrue(res["FGT60F0000000001"].registered)
+        self.assertEqual(self.journal.get("product:FGT60F0000000002")["attempts"], 2)
+
+    def test_timeout_left_submitted(self):
+        units = [ProductRegistrationUnit(serialNumber="FGT60F0000000001")]
+        with patch.object(requests.Session, "post", side_effect=requests.exceptions.ReadTimeout("read timed out")):
+            res = self.forticare.register_products_bulk(units, journal=self.journal)
+        self.assertFalse(res["FGT60F0000000001"].registered)
+        self.assertEqual(self.journal.get("product:FGT60F0000000001")["state"], "submitted")
+
+        # the registration went through: the next run finds it instead of submitting it again
+        response = requests.Response()
+        response.status_code = 200
+        asset = {"serialNumber": "FGT60F0000000001", "status": "Registered", "registrationDate": "2024-01-18T00:13:44"}
+        response._content = bytes(json.dumps({"status": 0, "assetDetails": asset}), "utf-8")
+        with patch.object(requests.Session, "post", return_value=response) as mock_method:
+            res = self.forticare.register_products_bulk(units, journal=self.journal)
+        self.assertEqual(mock_method.call_args.args[0].rsplit("/", 2)[-2:], ["products", "details"])
+        self.assertTrue(res["FGT60F0000000001"].registered)
+        self.assertEqual(self.journal.summary(), {"registered": 1})
+
+
+class LoaderTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.forticare = FortiCare(API_USERNAME, API_PASSWORD)
+        self.forticare.token = "toto"
+
+    def test_load_csv(self):
+        source = io.StringIO(
+            "serialNumber,cloudKey,isGovernment,address,postalCode,countryCode,comment\n"
+            "FGT60F0000000001,ABC,false,1 Main St,75001,FR,first\n"
+            "FGT60F0000000002,,yes,,,,\n"
+            ",DEF,false,,,,missing serial\n"
+        )
+        rows = load_units(source, format="csv")
+        unit, location = next(rows)
+        self.assertEqual(unit.serialNumber, "FGT60F0000000001")
+        self.assertEqual(unit.cloudKey, "ABC")
+        self.assertEqual(location, Location("1 Main St", "75001", "FR"))
+        unit, location = next(rows)
+        self.assertTrue(unit.isGovernment)
+        self.assertIsNone(location)
+        with self.assertRaisesRegex(ValueError, "line 4"):
+            next(rows)
+
+    def test_load_ndjson_skip_invalid(self):
+        source = io.StringIO(
+            '{"licenseRegistrationCode": "K06V2-0001"}\n'
+            "\n"
+            '{"licenseRegistrationCode": "K06V2-0002", "isGovernment": "maybe"}\n'
+            '{"licenseRegistrationCode": \n'
+            '{"licenseRegistrationCode": "K06V2-0003", "description": "VM"}\n'
+        )
+        units = [unit for unit, _ in load_units(source, kind="license", format="ndjson", skip_invalid=True)]
+        self.assertEqual([unit.licenseRegistrationCode for unit in units], ["K06V2-0001", "K06V2-0003"])
+        self.assertTrue(all(isinstance(unit, LicenseRegistrationUnit) for unit in units))
+        self.assertEqual(units[1].description, "VM")
+
+    def test_register_from_file(self):
+        def _post(url, **kwargs):
+            serials = [unit["serialNumber"] for unit in kwargs["json"]["registrationUnits"]]
+            response = requests.Response()
+            response.status_code = 200
+            assets = [{"serialNumber": sn, "status": "Registered"} for sn in serials]
+            response._content = bytes(json.dumps({"status": 0, "assets": assets}), "utf-8")
+            return response
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "units.csv")
+            with open(path, "w", encoding="utf-8") as _f:
+                _f.write("serialNumber,address\n")
+                for index in range(5):
+                    _f.write(f"FGT60F000000000{index},Site {index % 2}\n")
+            with patch.object(requests.Session, "post", side_effect=_post) as mock_method:
+                res = list(self.forticare.register_from_file(path, batch_size=2))
+
+        self.assertEqual(mock_method.call_count, 3)
+        self.assertEqual([serial for serial, _ in res], [f"FGT60F000000000{index}" for index in range(5)])
+        self.assertTrue(all(result.registered for _, result in res))
+        body = mock_method.call_args_list[0].kwargs["json"]
+        self.assertEqual(body["locations"], [{"address": "Site 0"}, {"address": "Site 1"}])
+
+
+class ValidationTestCase(unittest.TestCase):
+
+    def test_validate_products(self):
+        units = [
+            ProductRegistrationUnit("FGT60F0000000001"),
+            ProductRegistrationUnit("FGT60F0000000002"),
+            ProductRegistrationUnit("fgt-60f"),
+            ProductRegistrationUnit("FGT60F0000000001", contractNumber="1234"),
+        ]
+        locations = [
+            ("FGT60F0000000001", Location("Site 1")),
+            ("FGT60F0000000001", Location("Site 2")),
+            ("FGT60F0000000003", Location("Site 3")),
+            ("fgt-60f", Location("Site 4")),
+        ]
+        report = validate_units(units, locations)
+        self.assertFalse(report.ok)
+        self.assertEqual(report.valid_units, units[:2])
+        self.assertEqual(report.invalid_units, units[2:])
+        self.assertEqual(report.valid_locations, locations[:1])
+        self.assertEqual(
+            [(issue["index"], issue["key"], issue["field"]) for issue in report.issues],
+            [
+                (2, "fgt-60f", "serialNumber"),
+                (3, "FGT60F0000000001", "serialNumber"),
+                (None, "FGT60F0000000001", "location"),
+                (None, "FGT60F0000000003", "location"),
+            ],
+        )
+        self.assertEqual(report.to_json()["invalid"], 2)
+
+    def test_validate_licenses(self):
+        units = [
+            LicenseRegistrationUnit("K06V2-U795H-9PKR7-2TXNM-V8GL6B"),
+            LicenseRegistrationUnit(""),
+            LicenseRegistrationUnit("not a code"),
+            LicenseRegistrationUnit("K06V2-U795H-9PKR7-2TXNM-V8GL6B", serialNumber="FGVM0000000001XX"),
+        ]
+        report = validate_units(units)
+        self.assertEqual(report.valid_units, units[:1])
+        self.assertEqual([issue["index"] for issue in report.issues], [1, 2, 3])
+        self.assertTrue(validate_units(units[:1]).ok)
+
+
+class AssetModelTestCase(unittest.TestCase):
+
+    def test_slots(self):
+        data = {
+            "serialNumber": "FGT60F0000000001",
+            "registrationDate": "2024-01-18T00:13:44",
+            "entitlements": [
+                {"startDate": "2024-01-18T00:00:00", "endDate": "2025-01-18T00:00:00", "level": "20", "type": "11"}
+            ],
+            "contracts": [
+                {
+                    "contractNumber": "5762CL381100",
+                    "terms": [{"startDate": "2024-01-18T00:00:00", "endDate": "2025-01-18T00:00:00"}],
+                }
+            ],
+            "assetGroups": [{"assetGroupId": 1, "assetGroup": "Lab"}],
+            "licenses": [{"licenseNumber": "FMCLD4713562246"}],
+        }
+        asset = Asset(data)
+        for obj in (asset, asset.entitlements[0], asset.contracts[0], asset.contracts[0].terms[0], asset.licenses[0]):
+            self.assertFalse(hasattr(obj, "__dict__"))
+        self.assertEqual(Asset(asset.to_json()).to_json(), asset.to_json())
+        self.assertEqual(asset.to_json()["entitlements"][0]["endDate"], "2025-01-18T00:00:00")
+
+        lazy = Asset(data, lazy=True)
+        self.assertEqual(lazy.serialNumber, "FGT60F0000000001")
+        with patch("forticare.asset.Service", side_effect=Service) as mock_service:
+            self.assertIs(lazy.entitlements, lazy.entitlements)
+        self.assertEqual(mock_service.call_count, 1)
+        self.assertEqual(lazy.to_json(), asset.to_json())
+
+    def test_parse_datetime(self):
+        self.assertEqual(parse_datetime("2024-01-18T00:13:44"), dt.datetime(2024, 1, 18, 0, 13, 44))
+        self.assertIs(
+            parse_datetime("2024-01-18T00:13:44", "endDate"), parse_datetime("2024-01-18T00:13:44", "endDate")
+        )
+        self.assertEqual(
+            parse_datetime("2024-01-18 00:13:44+0000", "startDate"),
+            dt.datetime(2024, 1, 18, 0, 13, 44, tzinfo=dt.timezone.utc),
+        )
+        self.assertEqual(parse_datetime("2024-01-18T00:13:44", "startDate"), dt.datetime(2024, 1, 18, 0, 13, 44))
+        self.assertEqual(parse_datetime("2024-1-8T00:00:00"), dt.datetime(2024, 1, 8))
+        for date in (None, "2024-13-18T00:13:44", "2024-01-18", "2024-01-18T00:13:4x"):
+            with self.assertRaises(ValueError):
+                parse_datetime(date)
+
+    def test_lazy_get_products(self):
+        response = requests.Response()
+        response.status_code = 200
+        assets = [{"serialNumber": "FGT60F0000000001", "registrationDate": None, "status": "Registered"}]
+        response._content = bytes(json.dumps({"status": 0, "assets": assets}), "utf-8")
+        forticare = FortiCare(API_USERNAME, API_PASSWORD)
+        forticare.token = "toto"
+        with patch.object(requests.Session, "post", return_value=response):
+            res = forticare.get_products(dt.datetime.now(), lazy=True)
+        # the invalid date only raises when it is read
+        self.assertEqual(res[0].status, "Registered")
+        with self.assertRaises(ValueError):
+            res[0].registrationDate
+
+
+class RawModeTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.forticare = FortiCare(API_USERNAME, API_PASSWORD)
+        self.forticare.token = "toto"
+
+    def _response(self, data):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = bytes(json.dumps(dict(data, status=0)), "utf-8")
+        return response
+
+    def test_raw(self):
+        asset = {"serialNumber": "FGT60F0000000001", "registrationDate": "2024-01-18T00:13:44", "entitlements": []}
+        with patch.object(requests.Session, "post", return_value=self._response({"assets": [asset]})):
+            self.assertEqual(self.forticare.get_products(dt.datetime.now(), raw=True), [asset])
+            self.assertEqual(list(self.forticare.iter_products(dt.datetime.now(), raw=True)), [asset])
+        with patch.object(requests.Session, "post", return_value=self._response({"assetDetails": asset})):
+            self.assertEqual(self.forticare.get_product_details("FGT60F0000000001", raw=True), asset)
+        license = {"licenseNumber": "FMCLD4713562246", "licenseSKU": "FMG-VM-CLOUD", "status": "Registered"}
+        with patch.object(requests.Session, "post", return_value=self._response({"licenses": [license]})):
+            self.assertEqual(self.forticare.get_licenses(raw=True), [license])
+        with patch.object(requests.Session, "post", return_value=self._response({"licenses": None})):
+            self.assertEqual(self.forticare.get_licenses(raw=True), [])
+            self.assertEqual(self.forticare.get_licenses(), [])
+        with patch.object(requests.Session, "post", return_value=self._response({"assets": None})):
+            self.assertEqual(self.forticare.get_products(dt.datetime.now(), raw=True), [])
+            self.assertEqual(self.forticare.get_products(dt.datetime.now()), [])
+
+
+class AssetTableTestCase(unittest.TestCase):
+    """Runs without NumPy, see AssetTableNumpyTestCase"""
+
+    numpy = None
+
+    def _asset(self, serial, model, folder, end_date, status="Registered"):
+        return {
+            "serialNumber": serial,
+            "productModel": model,
+            "folderPath": folder,
+            "status": status,
+            "registrationDate": "2023-01-18T00:13:44",
+            "entitlements": [
+                {"startDate": "2023-01-18T00:00:00", "endDate": "2024-01-18T00:00:00", "type": "11"},
+                {"startDate": "2023-01-18T00:00:00", "endDate": end_date, "type": "12"},
+            ],
+        }
+
+    def setUp(self) -> None:
+        self.pages = [
+            {
+                "assets": [
+                    self._asset("FGT60F0000000001", "FortiGate 60F", "/Paris", "2025-02-01T00:00:00"),
+                    self._asset("FGT60F0000000002", "FortiGate 60F", "/Lyon", "2025-05-01T00:00:00"),
+                ],
+                "totalPages": 2,
+            },
+            {
+                "assets": [
+                    self._asset("FGT40F0000000003", "FortiGate 40F", "/Paris", "2025-03-01T00:00:00"),
+                    self._asset("FGT60F0000000004", "FortiGate 60F", "/Paris", "2025-03-15T00:00:00", "Pending"),
+                ],
+                "totalPages": 2,
+            },
+        ]
+        patcher = patch("forticare._table.np", self.numpy)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.table = AssetTable.from_responses(self.pages)
+
+    def test_filter_group_count(self):
+        self.assertEqual(len(self.table), 4)
+        quarter = self.table.expiring(before=dt.datetime(2025, 4, 1), after=dt.datetime(2025, 1, 1))
+        self.assertEqual(quarter.column("serialNumber"), ["FGT60F0000000001", "FGT40F0000000003", "FGT60F0000000004"])
+        self.assertEqual(quarter.group_count("productModel"), {"FortiGate 60F": 2, "FortiGate 40F": 1})
+        self.assertEqual(
+            quarter.where("status", "Registered").group_count("productModel", "folderPath"),
+            {("FortiGate 60F", "/Paris"): 1, ("FortiGate 40F", "/Paris"): 1},
+        )
+        self.assertEqual(len(self.table.where("folderPath", ["/Lyon", "/Nowhere"])), 1)
+        self.assertEqual(len(self.table.where("productModel", "FortiGate 100F")), 0)
+        self.assertEqual(
+            list(self.table.column("entitlementEndDate"))[0],
+            dt.datetime(2025, 2, 1, tzinfo=dt.timezone.utc).timestamp(),
+        )
+
+    def test_extend_after_column(self):
+        end_dates = self.table.column("entitlementEndDate")
+        self.table.extend(self.pages[0]["assets"])
+        end_dates[0] = 0
+        self.assertEqual(len(self.table), 6)
+        self.assertEqual(sum(self.table.group_count("status").values()), 6)
+        self.assertEqual(len(self.table.column("entitlementEndDate")), 6)
+        self.assertEqual(self.table.column("entitlementEndDate")[0], self.table.column("entitlementEndDate")[4])
+
+    def test_assets(self):
+        with self.assertRaises(ValueError):
+            self.table.to_assets()
+        table = AssetTable.from_responses(self.pages, keep_rows=True)
+        assets = table.expiring(before=dt.datetime(2025, 4, 1)).to_assets()
+        self.assertTrue(all(isinstance(asset, Asset) for asset in assets))
+        self.assertEqual(len(assets), 3)
+        self.assertEqual(table.asset(2).serialNumber, "FGT40F0000000003")
+        table = AssetTable.from_assets(assets)
+        self.assertEqual(table.group_count("status"), {"Registered": 2, "Pending": 1})
+
+    def test_get_products_table(self):
+        forticare = FortiCare(API_USERNAME, API_PASSWORD)
+        forticare.token = "toto"
+        responses = []
+        for page in self.pages:
+            response = requests.Response()
+            response.status_code = 200
+            response._content = bytes(json.dumps(dict(page, status=0)), "utf-8")
+            responses.append(response)
+        with patch.object(requests.Session, "post", side_effect=responses):
+            table = forticare.get_products_table(dt.datetime(2026, 1, 1))
+        self.assertEqual(table.column("serialNumber"), self.table.column("serialNumber"))
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class AssetTableNumpyTestCase(AssetTableTestCase):
+    """Same tests, filters and counts running on NumPy"""
+
+    numpy = numpy
+
+    def test_numpy_columns(self):
+        self.assertIsInstance(self.table.column("registrationDate"), numpy.ndarray)
+        self.assertIsInstance(self.table.where("status", "Pending").column("warrantyEndDate"), numpy.ndarray)
+        self.assertTrue(numpy.isnan(self.table.column("warrantyEndDate")).all())
+
+
+class ExpiryIndexTestCase(unittest.TestCase):
+
+    def _asset(self, serial, entitlements, warranties=()):
+        def _service(end_date, type, level):
+            return {"startDate": "2023-01-01T00:00:00", "endDate": end_date, "type": type, "level": level}
+
+        return Asset(
+            {
+                "serialNumber": serial,
+                "registrationDate": "2023-01-01T00:00:00",
+                "entitlements": [_service(*entitlement) for entitlement in entitlements],
+                "warrantySupports": [_service(*warranty) for warranty in warranties],
+            }
+        )
+
+    def setUp(self) -> None:
+        self.index = ExpiryIndex(
+            [
+                self._asset("FGT60F0000000001", [("2025-03-01T00:00:00", 11, 20), ("2026-03-01T00:00:00", 12, 20)]),
+                self._asset("FGT60F0000000002", [("2025-01-15T00:00:00", 11, 10)], [("2025-02-01T00:00:00", 1, 1)]),
+                self._asset("FGT60F0000000003", [("2025-06-01T00:00:00", 12, 20)]),
+            ]
+        )
+
+    def test_range_queries(self):
+        self.assertEqual(len(self.index), 5)
+        self.assertEqual(self.index.serials(before=dt.datetime(2025, 4, 1)), ["FGT60F0000000002", "FGT60F0000000001"])
+        self.assertEqual(
+            self.index.serials(before=dt.datetime(2025, 4, 1), warranty=False), ["FGT60F0000000002", "FGT60F0000000001"]
+        )
+        self.assertEqual(
+            self.index.serials(after=dt.datetime(2025, 3, 1), type=12), ["FGT60F0000000003", "FGT60F0000000001"]
+        )
+        self.assertEqual(self.index.serials(level=20, before=dt.datetime(2025, 3, 1)), [])
+        self.assertEqual(self.index.serials(level=20, before=dt.datetime(2025, 3, 2)), ["FGT60F0000000001"])
+        self.assertEqual(self.index.serials(type=11, level=10), ["FGT60F0000000002"])
+        entries = list(self.index.entries(warranty=True))
+        self.assertEqual(
+            [(end_date, serial) for end_date, serial, _ in entries], [(dt.datetime(2025, 2, 1), "FGT60F0000000002")]
+        )
+
+    def test_refresh(self):
+        self.index.add(self._asset("FGT60F0000000002", [("2027-01-15T00:00:00", 11, 10)]))
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual(self.index.serials(before=dt.datetime(2025, 4, 1)), ["FGT60F0000000001"])
+        self.assertEqual(self.index.serials(after=dt.datetime(2027, 1, 1)), ["FGT60F0000000002"])
+        self.index.remove("FGT60F0000000001")
+        self.assertNotIn("FGT60F0000000001", self.index)
+        self.assertEqual(self.index.serials(), ["FGT60F0000000003", "FGT60F0000000002"])
+        self.assertEqual(self.index.serials(level=20), ["FGT60F0000000003"])
+
+    def test_mixed_offsets(self):
+        self.index.add(self._asset("FGT60F0000000004", [("2025-03-01 01:00:00+0200", 11, 20)]))
+        self.assertEqual(self.index.serials(type=11), ["FGT60F0000000002", "FGT60F0000000004", "FGT60F0000000001"])
+        paris = dt.timezone(dt.timedelta(hours=1))
+        self.assertEqual(
+            self.index.serials(after=dt.datetime(2025, 3, 1, 0, 30, tzinfo=paris), before=dt.datetime(2025, 4, 1)),
+            ["FGT60F0000000001"],
+        )